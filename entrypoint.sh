@@ -10,6 +10,15 @@ python manage.py migrate --noinput
 # Collect static files
 python manage.py collectstatic --noinput
 
+# "serve" starts the app server; LIBRARY_SERVER_MODE picks WSGI (gunicorn, default) or ASGI (uvicorn)
+if [ "$1" = 'serve' ]; then
+    workers="${WEB_CONCURRENCY:-3}"
+    if [ "${LIBRARY_SERVER_MODE:-wsgi}" = 'asgi' ]; then
+        exec uvicorn library_system.asgi:application --host 0.0.0.0 --port 8000 --workers "$workers"
+    fi
+    exec gunicorn library_system.wsgi:application --bind 0.0.0.0:8000 --workers "$workers"
+fi
+
 # If a custom command was provided, run it; otherwise default CMD in Dockerfile will run
 if [ "${1:0:1}" = '-' ]; then
     exec "$@"
@@ -1,17 +1,22 @@
-from django.contrib import admin
-from .models import Book, Member, Borrow
+from django.contrib import admin, messages
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+from .circulation import cancel_hold
+from .models import ArchivedBorrow, Book, Hold, Member, Borrow
 
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'isbn', 'available_copies', 'total_borrowed', 'added_by', 'added_date']
+    list_display = ['title', 'author', 'isbn', 'available_copies', 'loan_period_days', 'total_borrowed', 'added_by', 'added_date']
     list_filter = ['available_copies', 'added_date']
+    list_select_related = ['added_by']
     search_fields = ['title', 'author', 'isbn']
     readonly_fields = ['total_borrowed', 'added_by', 'added_date']
     
+    @admin.display(description='Currently Borrowed', ordering='open_loans')
     def total_borrowed(self, obj):
-        return Borrow.objects.filter(book=obj, returned=False).count()
-    total_borrowed.short_description = 'Currently Borrowed'
+        return obj.open_loans
     
     def save_model(self, request, obj, form, change):
         if not change:  # Only set added_by for new books
@@ -23,26 +28,54 @@ class BookAdmin(admin.ModelAdmin):
 class MemberAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'user', 'joined_date', 'is_active', 'total_borrowed', 'active_borrows']
     list_filter = ['joined_date', 'is_active']
+    list_select_related = ['user']
     search_fields = ['name', 'email', 'user__username']
     readonly_fields = ['total_borrowed', 'active_borrows']
     
+    @admin.display(description='Total Books Borrowed', ordering='total_loans')
     def total_borrowed(self, obj):
-        return Borrow.objects.filter(member=obj).count()
-    total_borrowed.short_description = 'Total Books Borrowed'
+        return obj.total_loans
     
+    @admin.display(description='Currently Borrowed', ordering='open_loans')
     def active_borrows(self, obj):
-        return Borrow.objects.filter(member=obj, returned=False).count()
-    active_borrows.short_description = 'Currently Borrowed'
+        return obj.open_loans
 
 
 @admin.register(Borrow)
 class BorrowAdmin(admin.ModelAdmin):
-    list_display = ['book', 'member', 'borrowed_by', 'borrow_date', 'return_date', 'returned_by', 'returned', 'days_borrowed']
-    list_filter = ['returned', 'borrow_date', 'return_date']
+    list_display = ['book', 'member', 'borrowed_by', 'borrow_date', 'due_date', 'return_date', 'returned_by', 'returned', 'overdue', 'days_borrowed']
+    list_filter = ['returned', 'overdue', 'borrow_date', 'return_date']
+    list_select_related = ['book', 'member', 'borrowed_by', 'returned_by']
     search_fields = ['book__title', 'book__author', 'member__name', 'member__email', 'borrowed_by__username', 'returned_by__username']
     readonly_fields = ['days_borrowed']
     date_hierarchy = 'borrow_date'
     
+    def get_search_results(self, request, queryset, search_term):
+        """Match each term as a substring of the related fields, then borrows by foreign key.
+    
+        Same semantics as search_fields: every term must be contained in one
+        of the fields. The default search joins all four tables for every
+        borrow; here each term is resolved against the much smaller book,
+        member and user tables, and borrows are found through their foreign
+        key indexes.
+        """
+        for term in smart_split(search_term):
+            if term.startswith(('"', "'")) and term[0] == term[-1]:
+                term = unescape_string_literal(term)
+            if not term:
+                continue
+            book_ids = Book.objects.filter(Q(title__icontains=term) | Q(author__icontains=term)).values('id')
+            member_ids = Member.objects.filter(Q(name__icontains=term) | Q(email__icontains=term)).values('id')
+            user_ids = User.objects.filter(username__icontains=term).values('id')
+            queryset = queryset.filter(
+                Q(book__in=book_ids)
+                | Q(member__in=member_ids)
+                | Q(borrowed_by__in=user_ids)
+                | Q(returned_by__in=user_ids)
+            )
+        return queryset, False
+    
+    @admin.display(description='Days Borrowed')
     def days_borrowed(self, obj):
         if obj.returned and obj.return_date:
             return (obj.return_date - obj.borrow_date).days
@@ -50,4 +83,32 @@ class BorrowAdmin(admin.ModelAdmin):
             from django.utils import timezone
             return (timezone.now() - obj.borrow_date).days
         return 0
-    days_borrowed.short_description = 'Days Borrowed'
+
+
+@admin.register(ArchivedBorrow)
+class ArchivedBorrowAdmin(admin.ModelAdmin):
+    list_display = ['id', 'book', 'member', 'borrow_date', 'return_date', 'overdue', 'archived_at']
+    list_select_related = ['book', 'member']
+    raw_id_fields = ['book', 'member', 'borrowed_by', 'returned_by']
+    date_hierarchy = 'borrow_date'
+    
+    def has_add_permission(self, request):
+        # Rows only arrive through archive_borrows
+        return False
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ['book', 'member', 'status', 'requested_at', 'ready_at']
+    list_filter = ['status', 'requested_at']
+    list_select_related = ['book', 'member']
+    search_fields = ['book__title', 'member__name', 'member__email']
+    readonly_fields = ['status', 'ready_at']
+    raw_id_fields = ['book', 'member']
+    actions = ['cancel_holds']
+    
+    @admin.action(description='Cancel selected holds')
+    def cancel_holds(self, request, queryset):
+        # One at a time, so a copy set aside for a cancelled hold moves down the queue
+        cancelled = sum(cancel_hold(hold) for hold in queryset.filter(status__in=Hold.ACTIVE))
+        self.message_user(request, f'{cancelled} hold(s) cancelled.', messages.SUCCESS)
@@ -0,0 +1,96 @@
+"""Read-only JSON catalog API (v1) for kiosks and the OPAC front-end.
+
+Every response carries a strong ETag derived from the catalog version and
+the request URL, so a poll with a matching If-None-Match gets a 304 before
+any row is queried or serialized. The views are async so that under ASGI a
+single process can hold many concurrent polls.
+"""
+import hashlib
+
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .versions import CATALOG, get_version
+from .models import Book
+from .pagination import InvalidCursor, KeysetPaginator
+from .search import BOOK_SORTS, DEFAULT_BOOK_SORT, search_books
+
+
+API_VERSION = 'v1'
+API_BOOKS_PER_PAGE = 50
+API_AVAILABILITY_LIMIT = 100
+BOOK_FIELDS = ('id', 'title', 'author', 'isbn', 'available_copies')
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Strong ETag for a catalog response: the same URL at the same catalog version"""
+    raw = f'{API_VERSION}:{get_version(CATALOG)}:{request.get_full_path()}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def catalog_endpoint(view):
+    return require_GET(condition(etag_func=catalog_etag)(view))
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _book_json(book):
+    return {field: getattr(book, field) for field in BOOK_FIELDS}
+
+
+@catalog_endpoint
+async def books(request):
+    """One page of the catalog, optionally searched; follow ``next`` for the rest"""
+    sort = request.GET.get('sort', DEFAULT_BOOK_SORT)
+    if sort not in BOOK_SORTS:
+        return _error(f"Unknown sort; expected one of {', '.join(BOOK_SORTS)}", 400)
+    queryset = search_books(request.GET.get('q', '').strip()).only(*BOOK_FIELDS)
+    paginator = KeysetPaginator(queryset, BOOK_SORTS[sort], API_BOOKS_PER_PAGE)
+    try:
+        page = await paginator.apage(after=request.GET.get('after'))
+    except InvalidCursor:
+        return _error('Invalid cursor', 400)
+
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['after'] = page.next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({
+        'results': [_book_json(book) for book in page],
+        'next': next_url,
+    })
+
+
+@catalog_endpoint
+async def book_detail(request, book_id):
+    book = await Book.objects.only(*BOOK_FIELDS).filter(id=book_id).afirst()
+    if book is None:
+        return _error('Book not found', 404)
+    return JsonResponse(_book_json(book))
+
+
+@catalog_endpoint
+async def book_by_isbn(request, isbn):
+    isbn = ''.join(ch for ch in isbn if ch.isalnum()).upper()
+    book = await Book.objects.only(*BOOK_FIELDS).filter(isbn=isbn).afirst()
+    if book is None:
+        return _error('Book not found', 404)
+    return JsonResponse(_book_json(book))
+
+
+@catalog_endpoint
+async def availability(request):
+    """Copies on the shelf for ``?ids=1,2,3``, keyed by book id"""
+    try:
+        ids = sorted({int(part) for part in request.GET.get('ids', '').split(',') if part.strip()})
+    except ValueError:
+        return _error('ids must be a comma-separated list of book ids', 400)
+    if not ids:
+        return _error('ids is required', 400)
+    if len(ids) > API_AVAILABILITY_LIMIT:
+        return _error(f'At most {API_AVAILABILITY_LIMIT} ids per request', 400)
+    rows = Book.objects.filter(id__in=ids).values_list('id', 'available_copies')
+    return JsonResponse({'availability': {str(book_id): copies async for book_id, copies in rows}})
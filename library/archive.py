@@ -0,0 +1,72 @@
+"""Move closed loans out of the live borrow table into ArchivedBorrow.
+
+Archived rows keep their ids and columns. Pages that can show history
+(logs, exports, my_borrows) read them next to live rows when asked to, and
+the Book/Member loan counters, logs totals and rollups keep counting them.
+"""
+from django.db import connection, transaction
+from django.db.models import DateTimeField, Value
+from django.utils import timezone
+
+from .models import ArchivedBorrow, Borrow
+from .rollups import rollup_checkpoint
+from .stats import invalidate_borrow_stats
+
+
+# Keeps each batch's DELETE ... WHERE id IN (...) under SQLite's variable limit
+ARCHIVE_BATCH_SIZE = 500
+BORROW_COLUMNS = [field.attname for field in Borrow._meta.concrete_fields]
+
+
+def archivable_loans(before):
+    """Returned loans closed before ``before`` that the rollups have already counted.
+
+    Rollups only count the live table, so a loan must be folded in before
+    it leaves it; nothing is archivable until refresh_rollups has run.
+    """
+    checkpoint = rollup_checkpoint()
+    if checkpoint is None or checkpoint.returns_through is None:
+        return Borrow.objects.none()
+    return Borrow.objects.filter(
+        returned=True,
+        return_date__lt=before,
+        return_date__lte=checkpoint.returns_through,
+        id__lte=checkpoint.last_borrow_id,
+    )
+
+
+def archive_borrows(before, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move loans returned before ``before`` into the archive; return how many moved.
+
+    Each batch is copied and deleted in one transaction, oldest returns
+    first through the return_date index, so an interrupted run loses
+    nothing and the next one carries on where it stopped.
+    """
+    eligible = archivable_loans(before).order_by('return_date', 'id').values_list('id', flat=True)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in BORROW_COLUMNS + ['archived_at'])
+    archive_table, borrow_table = quote(ArchivedBorrow._meta.db_table), quote(Borrow._meta.db_table)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            ids = list(eligible[:batch_size])
+            if not ids:
+                break
+            # Copied in SQL rather than through model instances; a raw DELETE
+            # also skips the per-row post_delete handlers, which would only
+            # clear the stats cache once per loan
+            select = (
+                Borrow.objects.filter(id__in=ids).order_by()
+                .annotate(archived_at=Value(timezone.now(), output_field=DateTimeField()))
+                .values_list(*BORROW_COLUMNS, 'archived_at')
+            )
+            sql, params = select.query.sql_with_params()
+            placeholders = ', '.join(['%s'] * len(ids))
+            with connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {archive_table} ({columns}) {sql}', params)
+                cursor.execute(f'DELETE FROM {borrow_table} WHERE id IN ({placeholders})', ids)
+        archived += len(ids)
+    if archived:
+        invalidate_borrow_stats()
+    return archived
+
@@ -0,0 +1,16 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .utils import get_cached_user
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request user lookup is served from the cache.
+
+    With a cached session engine an authenticated request then reaches its
+    view without any SQL: the session, the user, its groups and its roles
+    all come from the cache.
+    """
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,208 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ArchivedBorrow, Book, Borrow, Hold, Member, loan_period
+from .stats import invalidate_borrow_stats
+from .versions import CATALOG, bump_version
+
+
+# Keeps each UPDATE ... WHERE id IN (...) under SQLite's variable limit
+RECONCILE_BATCH_SIZE = 500
+OVERDUE_CHUNK_SIZE = 5000
+
+
+class BookUnavailable(Exception):
+    """Raised when no copy of a book is left to lend"""
+
+
+class AlreadyReturned(Exception):
+    """Raised when a borrow has already been closed"""
+
+
+def lend_book(book, member, user):
+    """Lend one copy of ``book`` to ``member`` and return the new Borrow.
+
+    The stock check and the decrement are a single conditional UPDATE, so
+    concurrent checkouts can never oversell or lose an update. A member
+    collecting a hold takes the copy set aside for them instead; one taking
+    a shelf copy leaves the queue, so no later return sets a second copy
+    aside for them.
+    """
+    with transaction.atomic():
+        picked_up = Hold.objects.filter(book_id=book.pk, member_id=member.pk, status=Hold.READY).update(
+            status=Hold.FULFILLED
+        )
+        if picked_up:
+            # Already off the shelf since the return that allocated it
+            books, stock = Book.objects.filter(pk=book.pk), {}
+        else:
+            books, stock = Book.objects.filter(pk=book.pk, available_copies__gt=0), {
+                'available_copies': F('available_copies') - 1,
+            }
+        taken = books.update(**stock, open_loans=F('open_loans') + 1, total_loans=F('total_loans') + 1)
+        if not taken:
+            raise BookUnavailable(book)
+        if not picked_up:
+            Hold.objects.filter(book_id=book.pk, member_id=member.pk, status=Hold.WAITING).update(
+                status=Hold.FULFILLED
+            )
+        Member.objects.filter(pk=member.pk).update(
+            open_loans=F('open_loans') + 1,
+            total_loans=F('total_loans') + 1,
+        )
+        borrowed_at = timezone.now()
+        borrow = Borrow.objects.create(
+            book=book, member=member, borrowed_by=user,
+            borrow_date=borrowed_at, due_date=borrowed_at + loan_period(book),
+        )
+    # Bumped after commit so no reader caches the old stock under the new version
+    bump_version(CATALOG)
+    return borrow
+
+
+def receive_book(borrow, user):
+    """Close ``borrow`` and pass its copy to the next hold, or back to the shelf.
+
+    Only the request that flips ``returned`` increments the stock, so a
+    double-submitted return is reported instead of counted twice. The hold
+    the copy went to, if any, is left on ``borrow.allocated_hold``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        closed = Borrow.objects.filter(pk=borrow.pk, returned=False).update(
+            returned=True, return_date=now, returned_by=user
+        )
+        if not closed:
+            raise AlreadyReturned(borrow)
+        hold = _allocate_copy(borrow.book_id, now)
+        shelved = {} if hold else {'available_copies': F('available_copies') + 1}
+        # Floor at zero: a borrow entered outside lend_book() (admin, raw
+        # imports) never incremented the counter; reconcile_counters fixes it.
+        Book.objects.filter(pk=borrow.book_id).update(**shelved, open_loans=Greatest(F('open_loans') - 1, 0))
+        Member.objects.filter(pk=borrow.member_id).update(open_loans=Greatest(F('open_loans') - 1, 0))
+    borrow.allocated_hold = hold
+    borrow.returned = True
+    borrow.return_date = now
+    borrow.returned_by = user
+    # Queryset updates skip post_save, so drop the cached cards and catalog version here
+    invalidate_borrow_stats()
+    bump_version(CATALOG)
+    return borrow
+
+
+def _allocate_copy(book_id, now):
+    """Give a free copy of the book to its oldest waiting hold; return that hold or None.
+
+    One index seek on hold_queue_idx, however long the queue. Call inside
+    the transaction that freed the copy. SQLite holds the database write
+    lock by then, so concurrent returns queue up; on databases with row
+    locks, SKIP LOCKED sends each concurrent return to a different hold.
+    """
+    hold = (
+        Hold.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id, status=Hold.WAITING).order_by('requested_at', 'id').first()
+    )
+    if hold is not None:
+        Hold.objects.filter(pk=hold.pk).update(status=Hold.READY, ready_at=now)
+        hold.status, hold.ready_at = Hold.READY, now
+    return hold
+
+
+def place_hold(book, member):
+    """Queue ``member`` for ``book``; return ``(hold, created)``"""
+    existing = Hold.objects.filter(book=book, member=member, status__in=Hold.ACTIVE).first()
+    if existing is not None:
+        return existing, False
+    try:
+        with transaction.atomic():
+            return Hold.objects.create(book=book, member=member), True
+    except IntegrityError:
+        # A concurrent request queued the same member first
+        return Hold.objects.get(book=book, member=member, status__in=Hold.ACTIVE), False
+
+
+def queue_position(hold):
+    """1-based place of a waiting hold in its book's queue"""
+    ahead = Hold.objects.filter(book_id=hold.book_id, status=Hold.WAITING).filter(
+        Q(requested_at__lt=hold.requested_at) | Q(requested_at=hold.requested_at, id__lt=hold.id)
+    )
+    return ahead.count() + 1
+
+
+def cancel_hold(hold):
+    """Cancel an active hold; a copy set aside for it goes to the next hold or the shelf.
+
+    Returns False if the hold was no longer active.
+    """
+    with transaction.atomic():
+        if Hold.objects.filter(pk=hold.pk, status=Hold.WAITING).update(status=Hold.CANCELLED):
+            freed = False
+        elif Hold.objects.filter(pk=hold.pk, status=Hold.READY).update(status=Hold.CANCELLED):
+            freed = True
+        else:
+            return False
+        if freed and _allocate_copy(hold.book_id, timezone.now()) is None:
+            Book.objects.filter(pk=hold.book_id).update(available_copies=F('available_copies') + 1)
+    hold.status = Hold.CANCELLED
+    if freed:
+        bump_version(CATALOG)
+    return True
+
+
+def _loan_count(field, source=Borrow, **filters):
+    borrows = (
+        source.objects.filter(**{field: OuterRef('pk')}, **filters)
+        .order_by().values(field).annotate(count=Count('id')).values('count')
+    )
+    return Coalesce(Subquery(borrows, output_field=IntegerField()), Value(0))
+
+
+def reconcile_loan_counters(model, fix=True):
+    """Recount ``open_loans``/``total_loans`` on Book or Member from Borrow and ArchivedBorrow.
+
+    Returns the number of rows whose stored counters disagreed with the
+    borrow table; with ``fix`` those rows are rewritten in batches.
+    """
+    field = {Book: 'book', Member: 'member'}[model]
+    actual = {
+        'open_loans': _loan_count(field, returned=False),
+        'total_loans': _loan_count(field) + _loan_count(field, ArchivedBorrow),
+    }
+    drifted = model.objects.annotate(
+        actual_open=actual['open_loans'], actual_total=actual['total_loans'],
+    ).filter(~Q(open_loans=F('actual_open')) | ~Q(total_loans=F('actual_total')))
+    drifted_ids = list(drifted.values_list('pk', flat=True))
+    if fix:
+        for start in range(0, len(drifted_ids), RECONCILE_BATCH_SIZE):
+            batch = drifted_ids[start:start + RECONCILE_BATCH_SIZE]
+            model.objects.filter(pk__in=batch).update(**actual)
+    return len(drifted_ids)
+
+
+def overdue_loans(now=None):
+    """Open loans past their due date, read through the open-loans-by-due-date index"""
+    return Borrow.objects.filter(returned=False, due_date__lt=now or timezone.now()).order_by('due_date')
+
+
+def flag_overdue_loans(now=None, chunk_size=OVERDUE_CHUNK_SIZE):
+    """Set ``overdue`` on every open loan past due that isn't flagged yet; return how many.
+
+    Each chunk is one UPDATE ... WHERE id IN (SELECT ... LIMIT n) in its own
+    transaction, so no id list passes through Python and the write lock is
+    held only briefly. Flagged rows leave the index the subquery reads, so
+    every chunk starts at the next unflagged loan.
+    """
+    now = now or timezone.now()
+    flagged = 0
+    while True:
+        pending = (
+            Borrow.objects.filter(returned=False, overdue=False, due_date__lt=now)
+            .order_by('due_date').values('id')[:chunk_size]
+        )
+        with transaction.atomic():
+            updated = Borrow.objects.filter(id__in=pending).update(overdue=True)
+        flagged += updated
+        if updated < chunk_size:
+            return flagged
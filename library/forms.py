@@ -78,10 +78,10 @@ class BookForm(forms.ModelForm):
 
 
 class BorrowForm(forms.Form):
+    # Rendered once per page as a hidden input filled in by the shared member
+    # picker; the autocomplete endpoint supplies the choices, so the queryset
+    # is only touched when a submitted value is validated.
     member = forms.ModelChoiceField(
         queryset=Member.objects.filter(is_active=True),
-        empty_label="Select a member",
-        widget=forms.Select(attrs={
-            'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent dark:bg-gray-700 dark:border-gray-600 dark:text-white'
-        })
-    )
\ No newline at end of file
+        widget=forms.HiddenInput()
+    )
@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from library.archive import ARCHIVE_BATCH_SIZE, archivable_loans, archive_borrows
+from library.models import Borrow
+
+
+class Command(BaseCommand):
+    help = ('Move loans returned more than --older-than days ago from the live borrow table into the archive, '
+            'in batches; safe to interrupt and re-run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=365, metavar='DAYS',
+                            help='Archive loans returned at least this many days ago (default: 365)')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help=f'Loans moved per transaction (default: {ARCHIVE_BATCH_SIZE})')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the loans that would move')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--older-than must not be negative and --batch-size must be positive')
+        before = timezone.now() - timedelta(days=options['older_than'])
+
+        if options['dry_run']:
+            self.stdout.write(f'Archivable loans: {archivable_loans(before).count()}')
+            return
+        started = time.perf_counter()
+        archived = archive_borrows(before, options['batch_size'])
+        self.stdout.write(f'Archived {archived} loans returned before {before:%Y-%m-%d} '
+                          f'in {time.perf_counter() - started:.2f}s')
+        if Borrow.objects.filter(returned=True, return_date__lt=before).exists():
+            self.stdout.write(self.style.WARNING('Loans not yet counted by refresh_rollups are kept; run it first'))
+        self.stdout.write(self.style.SUCCESS('Archive complete'))
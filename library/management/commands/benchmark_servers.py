@@ -0,0 +1,247 @@
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from .benchmark_views import percentile
+
+
+SERVERS = {
+    'wsgi': ['gunicorn', 'library_system.wsgi:application', '--bind', '127.0.0.1:{port}', '--workers', '{workers}'],
+    'asgi': ['uvicorn', 'library_system.asgi:application', '--host', '127.0.0.1', '--port', '{port}',
+             '--workers', '{workers}', '--no-access-log'],
+}
+
+# Runs inside the seeded database: print session cookies for a librarian and the busiest member
+SESSIONS_SCRIPT = '''
+import json
+from django.contrib.auth.models import User
+from django.test import Client
+from library.models import Book, Member
+from library.search import search_books
+from library.views import book_paginator
+sessions = {}
+for role, user in (
+    ('librarian', User.objects.get(username='synthetic-librarian-0')),
+    ('member', Member.objects.filter(user__isnull=False).order_by('-total_loans').first().user),
+):
+    client = Client()
+    client.force_login(user)
+    sessions[role] = client.cookies['sessionid'].value
+book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:200])
+page_two = book_paginator(search_books('')).page().next_cursor
+print(json.dumps({'sessions': sessions, 'book_ids': book_ids, 'book_page_two': page_two}))
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway SQLite database, serve it with gunicorn (WSGI) and uvicorn (ASGI) in turn '
+            'and compare concurrent throughput and latency of kiosk/API polls and the read-only pages')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='2000:1000:20000',
+                            help='books:members:loans to seed (default: 2000:1000:20000)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--modes', default='wsgi,asgi', help='Comma-separated server modes to run')
+        parser.add_argument('--workers', type=int, default=3, help='Worker processes per server')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent client connections')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per mode')
+        parser.add_argument('--output', '-o', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        for mode in modes:
+            if mode not in SERVERS:
+                raise CommandError(f"Unknown mode {mode!r}; expected one of {', '.join(SERVERS)}")
+            if shutil.which(SERVERS[mode][0]) is None:
+                raise CommandError(f'{SERVERS[mode][0]} is not installed (see requirements.txt)')
+        try:
+            books, members, loans = (int(part) for part in options['scale'].split(':'))
+        except ValueError:
+            raise CommandError(f"Bad scale {options['scale']!r}; expected books:members:loans")
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--concurrency and --duration must be positive')
+
+        workdir = tempfile.mkdtemp(prefix='library-bench-')
+        # The servers run in their own processes, so they share a real database file, not a test DB
+        env = dict(os.environ, LIBRARY_DB_PATH=os.path.join(workdir, 'bench.sqlite3'),
+                   DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'library_system.settings'))
+        try:
+            self.stdout.write(f"Seeding {options['scale']}...")
+            self._manage(env, 'migrate', '--noinput')
+            self._manage(env, 'generate_data', f'--books={books}', f'--members={members}', f'--loans={loans}',
+                         f"--seed={options['seed']}")
+            fixture = json.loads(self._manage(env, 'shell', '-c', SESSIONS_SCRIPT).strip().splitlines()[-1])
+            report = {
+                'scale': options['scale'], 'workers': options['workers'],
+                'concurrency': options['concurrency'], 'duration_s': options['duration'], 'modes': {},
+            }
+            for mode in modes:
+                report['modes'][mode] = result = self._run_mode(mode, env, fixture, options)
+                self.stdout.write(
+                    f"{mode}: {result['requests_per_s']:8.1f} req/s  p50 {result['p50_ms']:7.2f}ms  "
+                    f"p95 {result['p95_ms']:7.2f}ms  {result['errors']} errors"
+                )
+                for name, view in result['views'].items():
+                    self.stdout.write(f"  {name:<22} {view['requests']:7d} requests  "
+                                      f"p50 {view['p50_ms']:7.2f}ms  p95 {view['p95_ms']:7.2f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def _manage(self, env, *args):
+        completed = subprocess.run([sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR, env=env,
+                                   capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f"manage.py {args[0]} failed:\n{completed.stderr}")
+        return completed.stdout
+
+    def _targets(self, fixture):
+        """(name, url, session role or None, conditional?) for each request in the mix"""
+        rng = random.Random(0)
+        ids = fixture['book_ids']
+        targets = []
+        # Kiosks poll availability of a shelf's worth of books and re-send the ETag they last saw
+        for _ in range(20):
+            shelf = ','.join(str(book_id) for book_id in sorted(rng.sample(ids, 12)))
+            targets.append(('api_availability', reverse('library:api_availability') + f'?ids={shelf}', None, True))
+        for query in ('', 'shadow', 'river', 'night'):
+            targets.append(('api_books', reverse('library:api_books') + f'?q={query}', None, True))
+        targets += [
+            ('book_list', reverse('library:book_list'), 'librarian', False),
+            ('book_list page 2', reverse('library:book_list') + f"?after={fixture['book_page_two']}", 'member', False),
+            ('logs', reverse('library:logs'), 'librarian', False),
+            ('my_borrows', reverse('library:my_borrows'), 'member', False),
+        ]
+        return targets
+
+    def _run_mode(self, mode, env, fixture, options):
+        port = free_port()
+        command = [part.format(port=port, workers=options['workers']) for part in SERVERS[mode]]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self._wait_until_ready(server, port)
+            targets = self._targets(fixture)
+            # One untimed pass warms every worker's caches and the kiosks' ETags
+            etags = {}
+            for _ in range(options['workers']):
+                for target in targets:
+                    self._request(http.client.HTTPConnection('127.0.0.1', port), target, fixture, etags)
+            return self._load(port, targets, fixture, etags, options)
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    def _wait_until_ready(self, server, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Server exited with status {server.returncode}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', reverse('library:login'))
+                if connection.getresponse().status == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Server did not answer on port {port} within {timeout}s')
+
+    def _request(self, connection, target, fixture, etags):
+        """Send one request; return (status, new connection if the server closed it)"""
+        name, url, role, conditional = target
+        headers = {}
+        if role:
+            headers['Cookie'] = f"sessionid={fixture['sessions'][role]}"
+        if conditional and url in etags:
+            headers['If-None-Match'] = etags[url]
+        connection.request('GET', url, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if conditional and response.getheader('ETag'):
+            etags[url] = response.getheader('ETag')
+        if response.will_close:
+            connection.close()
+            connection = http.client.HTTPConnection(connection.host, connection.port)
+        return response.status, connection
+
+    def _load(self, port, targets, fixture, etags, options):
+        deadline = time.monotonic() + options['duration']
+        timings = {name: [] for name, *_ in targets}
+        errors = []
+        lock = threading.Lock()
+
+        def client(index):
+            rng = random.Random(index)
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local = {name: [] for name in timings}
+            failed = 0
+            while time.monotonic() < deadline:
+                target = rng.choice(targets)
+                started = time.perf_counter()
+                try:
+                    status, connection = self._request(connection, target, fixture, etags)
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    continue
+                local[target[0]].append((time.perf_counter() - started) * 1000)
+                if status >= 400:
+                    failed += 1
+            connection.close()
+            with lock:
+                for name, samples in local.items():
+                    timings[name].extend(samples)
+                errors.append(failed)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        every = [sample for samples in timings.values() for sample in samples]
+        if not every:
+            raise CommandError('No request completed')
+        return {
+            'requests': len(every),
+            'requests_per_s': round(len(every) / elapsed, 1),
+            'p50_ms': round(percentile(every, 50), 3),
+            'p95_ms': round(percentile(every, 95), 3),
+            'errors': sum(errors),
+            'views': {
+                name: {
+                    'requests': len(samples),
+                    'p50_ms': round(percentile(samples, 50), 3),
+                    'p95_ms': round(percentile(samples, 95), 3),
+                }
+                for name, samples in timings.items() if samples
+            },
+        }
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections
+from library.circulation import AlreadyReturned, BookUnavailable, lend_book, receive_book
+from library.models import Book, Borrow, Member
+from library.search import DEFAULT_BOOK_SORT, search_books
+
+from .benchmark_views import percentile
+
+
+# Seconds between launching the workers and the common start line, so that
+# none gets a head start while the others are still importing Django
+START_DELAY = 3
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway SQLite file, then let several worker processes check books out and in '
+            'and read catalog pages against it under each database profile; report throughput, '
+            'latency and "database is locked" errors')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='development,production',
+                            help='Comma-separated LIBRARY_DB_PROFILE values to compare')
+        parser.add_argument('--workers', type=int, default=3, help='Concurrent worker processes')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per profile')
+        parser.add_argument('--write-ratio', type=float, default=0.3,
+                            help='Share of operations that are checkouts or returns (default: 0.3)')
+        parser.add_argument('--scale', default='2000:1000:20000',
+                            help='books:members:loans to seed (default: 2000:1000:20000)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', '-o', help='Write the JSON report to this file')
+        # Internal: run one load-generating worker against the configured database
+        parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+        parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1')
+        if options['worker']:
+            return self._work(options)
+
+        profiles = [profile.strip() for profile in options['profiles'].split(',') if profile.strip()]
+        for profile in profiles:
+            if profile not in settings.DATABASE_PROFILES:
+                raise CommandError(f"Unknown profile {profile!r}; expected one of {', '.join(settings.DATABASE_PROFILES)}")
+        try:
+            books, members, loans = (int(part) for part in options['scale'].split(':'))
+        except ValueError:
+            raise CommandError(f"Bad scale {options['scale']!r}; expected books:members:loans")
+        if options['workers'] < 1 or options['duration'] <= 0:
+            raise CommandError('--workers and --duration must be positive')
+
+        workdir = tempfile.mkdtemp(prefix='library-sqlite-bench-')
+        seeded = os.path.join(workdir, 'seeded.sqlite3')
+        try:
+            self.stdout.write(f"Seeding {options['scale']}...")
+            env = self._env(seeded, 'development')
+            self._manage(env, 'migrate', '--noinput')
+            self._manage(env, 'generate_data', f'--books={books}', f'--members={members}', f'--loans={loans}',
+                         f"--seed={options['seed']}")
+            report = {
+                'scale': options['scale'], 'workers': options['workers'], 'duration_s': options['duration'],
+                'write_ratio': options['write_ratio'], 'profiles': {},
+            }
+            for profile in profiles:
+                # Every profile starts from the same rows and a rollback-journal file
+                database = os.path.join(workdir, f'{profile}.sqlite3')
+                shutil.copyfile(seeded, database)
+                report['profiles'][profile] = result = self._run_profile(profile, database, options)
+                self.stdout.write(
+                    f"{profile}: {result['writes_per_s']:8.1f} writes/s (p95 {result['write_p95_ms']:7.2f}ms)  "
+                    f"{result['reads_per_s']:8.1f} reads/s (p95 {result['read_p95_ms']:7.2f}ms)  "
+                    f"{result['locked']} locked"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def _env(self, database, profile):
+        env = dict(os.environ, LIBRARY_DB_PATH=database, LIBRARY_DB_PROFILE=profile)
+        env.pop('LIBRARY_REPLICA_PATH', None)
+        return env
+
+    def _manage(self, env, *args):
+        completed = subprocess.run([sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR, env=env,
+                                   capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f"manage.py {args[0]} failed:\n{completed.stderr}")
+        return completed.stdout
+
+    def _run_profile(self, profile, database, options):
+        start_at = time.time() + START_DELAY
+        workers = [
+            subprocess.Popen(
+                [sys.executable, 'manage.py', 'benchmark_sqlite', '--worker', f'--start-at={start_at}',
+                 f"--duration={options['duration']}", f"--write-ratio={options['write_ratio']}",
+                 f"--seed={options['seed'] + index}"],
+                cwd=settings.BASE_DIR, env=self._env(database, profile),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            for index in range(options['workers'])
+        ]
+        results = []
+        for worker in workers:
+            stdout, stderr = worker.communicate()
+            if worker.returncode:
+                raise CommandError(f'A {profile} worker failed:\n{stderr}')
+            results.append(json.loads(stdout.strip().splitlines()[-1]))
+
+        writes = [sample for result in results for sample in result['writes']]
+        reads = [sample for result in results for sample in result['reads']]
+        return {
+            'writes_per_s': round(len(writes) / options['duration'], 1),
+            'reads_per_s': round(len(reads) / options['duration'], 1),
+            'write_p95_ms': round(percentile(writes, 95), 3) if writes else 0.0,
+            'read_p95_ms': round(percentile(reads, 95), 3) if reads else 0.0,
+            'locked': sum(result['locked'] for result in results),
+        }
+
+    def _work(self, options):
+        """Load generator run in each worker process; prints its samples as JSON"""
+        rng = random.Random(options['seed'])
+        librarian = User.objects.get(username='synthetic-librarian-0')
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        member_ids = list(Member.objects.values_list('id', flat=True))
+        lent = []
+        close_old_connections()
+
+        def write():
+            # Return about as many books as are lent so stock doesn't run dry
+            if lent and rng.random() < 0.5:
+                borrow = Borrow.objects.select_related('book', 'member').get(id=lent.pop(rng.randrange(len(lent))))
+                try:
+                    receive_book(borrow, librarian)
+                except AlreadyReturned:
+                    pass
+                return
+            book = Book.objects.get(id=rng.choice(book_ids))
+            member = Member.objects.get(id=rng.choice(member_ids))
+            try:
+                lent.append(lend_book(book, member, librarian).id)
+            except BookUnavailable:
+                pass
+
+        def read():
+            # Roughly what a catalog page and a member's history page query
+            list(search_books('', DEFAULT_BOOK_SORT)[rng.randrange(0, 500):][:25])
+            list(Borrow.objects.filter(member_id=rng.choice(member_ids)).select_related('book')[:50])
+            Borrow.objects.filter(returned=False).count()
+
+        time.sleep(max(0, options['start_at'] - time.time()))
+        deadline = time.monotonic() + options['duration']
+        samples = {'writes': [], 'reads': []}
+        locked = 0
+        while time.monotonic() < deadline:
+            is_write = rng.random() < options['write_ratio']
+            # Each operation stands in for one request: the request_started and
+            # request_finished handlers call close_old_connections() the same way
+            close_old_connections()
+            started = time.perf_counter()
+            try:
+                write() if is_write else read()
+            except OperationalError as exc:
+                if 'locked' not in str(exc):
+                    raise
+                locked += 1
+            else:
+                samples['writes' if is_write else 'reads'].append((time.perf_counter() - started) * 1000)
+            close_old_connections()
+        self.stdout.write(json.dumps({**samples, 'locked': locked}))
@@ -0,0 +1,169 @@
+import json
+import statistics
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from library.models import Book, Borrow, Member
+
+
+DEFAULT_SCALES = '1000:500:5000,10000:5000:50000'
+
+
+def parse_scales(value):
+    """Parse 'books:members:loans,...' into a list of dicts"""
+    scales = []
+    for spec in value.split(','):
+        try:
+            books, members, loans = (int(part) for part in spec.split(':'))
+        except ValueError:
+            raise CommandError(f'Bad scale {spec!r}; expected books:members:loans')
+        scales.append({'books': books, 'members': members, 'loans': loans})
+    return scales
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database at several scales and report latency, query count '
+            'and response size for the main library views')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default=DEFAULT_SCALES,
+                            help=f'Comma-separated books:members:loans triples (default: {DEFAULT_SCALES})')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per view and role')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', '-o', help='Write the JSON report to this file')
+        parser.add_argument('--baseline', help='Compare against a previously saved JSON report')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown against the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        scales = parse_scales(options['scales'])
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+
+        # Never touch the configured database: benchmark in a disposable copy
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = {'repeat': options['repeat'], 'scales': {}}
+            for scale in scales:
+                label = '{books}b-{members}m-{loans}l'.format(**scale)
+                self.stdout.write(f'Seeding {label}...')
+                call_command('generate_data', seed=options['seed'], flush=True, stdout=StringIO(), **scale)
+                cache.clear()
+                report['scales'][label] = self._run_scale(options['repeat'])
+                for name, result in report['scales'][label].items():
+                    self.stdout.write(
+                        f"  {name:<24} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                        f"{result['queries']:4d} queries  {result['bytes']:9d} bytes"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+            self.stdout.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+        if options['baseline']:
+            self._compare(report, options['baseline'], options['tolerance'])
+
+    def _client(self, username):
+        client = Client()
+        client.force_login(User.objects.get(username=username))
+        return client
+
+    def _run_scale(self, repeat):
+        librarian = self._client('synthetic-librarian-0')
+        # The busiest member gives my_borrows its worst case
+        busiest = Member.objects.filter(user__isnull=False).order_by('-total_loans').first()
+        member = self._client(busiest.user.username) if busiest else None
+
+        reads = [
+            ('book_list', reverse('library:book_list')),
+            ('book_search', reverse('library:book_list') + '?q=shadow'),
+            ('logs', reverse('library:logs')),
+            ('logs_unreturned', reverse('library:logs') + '?filter=unreturned'),
+            ('members', reverse('library:members')),
+        ]
+        results = {}
+        for name, url in reads:
+            results[f'librarian:{name}'] = self._measure(lambda: librarian.get(url), repeat)
+        if member:
+            for name, url in [('book_list', reverse('library:book_list')), ('my_borrows', reverse('library:my_borrows'))]:
+                results[f'member:{name}'] = self._measure(lambda: member.get(url), repeat)
+
+        # Writes: each timed borrow is undone by a timed return
+        book_ids = list(Book.objects.filter(available_copies__gt=0).values_list('id', flat=True)[:repeat + 1])
+        member_id = Member.objects.values_list('id', flat=True).first()
+        if book_ids and member_id:
+            pending = iter(book_ids)
+            results['librarian:borrow_book'] = self._measure(
+                lambda: librarian.get(reverse('library:borrow_book', args=[next(pending), member_id])),
+                min(repeat, len(book_ids) - 1),
+            )
+            open_ids = iter(Borrow.objects.filter(returned=False, book_id__in=book_ids)
+                            .values_list('id', flat=True)[:repeat + 1])
+            results['librarian:return_book'] = self._measure(
+                lambda: librarian.post(reverse('library:return_book', args=[next(open_ids)])),
+                min(repeat, len(book_ids) - 1),
+            )
+        return results
+
+    def _measure(self, request, repeat):
+        request()  # warm caches and lazy imports; not timed
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise CommandError(f'{response.request["PATH_INFO"]} returned {response.status_code}')
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'queries': len(queries.captured_queries),
+            'bytes': len(response.content) if not response.streaming else 0,
+            'status': response.status_code,
+        }
+
+    def _compare(self, report, baseline_path, tolerance):
+        try:
+            with open(baseline_path, encoding='utf-8') as handle:
+                baseline = json.load(handle)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read baseline {baseline_path}: {exc}')
+
+        regressions = []
+        for label, views in report['scales'].items():
+            for name, result in views.items():
+                before = baseline.get('scales', {}).get(label, {}).get(name)
+                if not before:
+                    continue
+                if result['queries'] > before['queries']:
+                    regressions.append(f"{label} {name}: queries {before['queries']} -> {result['queries']}")
+                if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                    regressions.append(f"{label} {name}: p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(f'REGRESSION {line}')
+            raise CommandError(f'{len(regressions)} regressions against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}'))
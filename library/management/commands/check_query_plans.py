@@ -0,0 +1,142 @@
+import re
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from library.models import Book, Borrow, Member
+from library.search import search_books
+from library.views import book_paginator
+
+
+# "SCAN <table>" with nothing after it: every row read, no index involved.
+# Index scans ("SCAN t USING INDEX i") and virtual tables (FTS) don't match.
+FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+# Views that read a whole table on purpose: the members page lists every
+# member and its summary card counts them all, and an unfiltered export
+# streams every borrow, live and (when asked) archived.
+EXPECTED_SCANS = {
+    'members': {'library_member'},
+    'export_logs all': {'library_borrow'},
+    'export_logs archived': {'library_borrow', 'library_archivedborrow'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway SQLite test database, request each library view and run EXPLAIN QUERY PLAN '
+            'on every SELECT it issues; fail if any query reads a whole table without an index')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='2000:1000:20000',
+                            help='books:members:loans to seed before explaining (default: 2000:1000:20000)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN checks only run against SQLite')
+        try:
+            books, members, loans = (int(part) for part in options['scale'].split(':'))
+        except ValueError:
+            raise CommandError(f"Bad scale {options['scale']!r}; expected books:members:loans")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('generate_data', books=books, members=members, loans=loans,
+                         seed=options['seed'], flush=True, stdout=StringIO())
+            call_command('refresh_rollups', stdout=StringIO())
+            call_command('archive_borrows', older_than=180, stdout=StringIO())
+            failures = self._check_views(options['verbose_plans'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if failures:
+            for line in failures:
+                self.stderr.write(f'FULL SCAN {line}')
+            raise CommandError(f'{len(failures)} queries fall back to a full table scan')
+        self.stdout.write(self.style.SUCCESS('No full table scans'))
+
+    def _requests(self):
+        """Yield (label, client, method, url) for every view worth explaining"""
+        anonymous = Client()
+        librarian = Client()
+        librarian.force_login(User.objects.get(username='synthetic-librarian-0'))
+        member_profile = Member.objects.filter(user__isnull=False).order_by('-total_loans').first()
+        member = Client()
+        member.force_login(member_profile.user)
+        book = Book.objects.order_by('id').first()
+        open_borrow = Borrow.objects.filter(returned=False, member=member_profile).order_by('-id').first()
+        paginator = book_paginator(search_books(''))
+        page_three = paginator.page(after=paginator.page().next_cursor).next_cursor
+
+        yield 'home', librarian, 'get', reverse('library:home')
+        yield 'book_list', librarian, 'get', reverse('library:book_list')
+        yield 'book_list page 3', member, 'get', reverse('library:book_list') + f'?after={page_three}'
+        yield 'book_list by author', librarian, 'get', reverse('library:book_list') + '?sort=-author'
+        yield 'book search', librarian, 'get', reverse('library:book_list') + '?q=shadow&sort=title'
+        yield 'edit_book', librarian, 'get', reverse('library:edit_book', args=[book.id])
+        yield 'members', librarian, 'get', reverse('library:members')
+        yield 'member_autocomplete', librarian, 'get', reverse('library:member_autocomplete') + '?q=gr'
+        for status in ('all', 'returned', 'unreturned'):
+            yield f'logs {status}', librarian, 'get', reverse('library:logs') + f'?filter={status}'
+        for status in ('all', 'unreturned'):
+            yield f'export_logs {status}', librarian, 'get', reverse('library:export_logs') + f'?status={status}'
+        yield 'api_books', anonymous, 'get', reverse('library:api_books') + '?sort=-author'
+        yield 'api_book_by_isbn', anonymous, 'get', reverse('library:api_book_by_isbn', args=[book.isbn])
+        yield 'api_availability', anonymous, 'get', reverse('library:api_availability') + f'?ids={book.id}'
+        yield 'my_borrows', member, 'get', reverse('library:my_borrows')
+        yield 'my_borrows archived', member, 'get', reverse('library:my_borrows') + '?archived=1'
+        yield 'logs archived', librarian, 'get', reverse('library:logs') + '?archived=1'
+        yield 'export_logs archived', librarian, 'get', reverse('library:export_logs') + '?archived=1'
+        yield 'reports', librarian, 'get', reverse('library:reports')
+        yield 'reports last year', librarian, 'get', reverse('library:reports') + '?since=' + str(
+            timezone.localdate() - timedelta(days=365))
+        if open_borrow:
+            yield 'return_book', member, 'post', reverse('library:return_book', args=[open_borrow.id])
+        yield 'borrow_book', librarian, 'get', reverse('library:borrow_book', args=[book.id, member_profile.id])
+
+    def _check_views(self, verbose):
+        failures = []
+        for label, client, method, url in self._requests():
+            cache.clear()
+            captured = []
+
+            def capture(execute, sql, params, many, context):
+                if sql.lstrip().upper().startswith('SELECT') and not many:
+                    captured.append((sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(capture):
+                response = getattr(client, method)(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if response.status_code >= 400:
+                raise CommandError(f'{label}: {url} returned {response.status_code}')
+
+            self.stdout.write(f'{label}: {len(captured)} queries')
+            for sql, params in captured:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    plan = [row[3] for row in cursor.fetchall()]
+                if verbose:
+                    self.stdout.write(f'  {sql}')
+                    for detail in plan:
+                        self.stdout.write(f'    {detail}')
+                for detail in plan:
+                    scan = FULL_SCAN.match(detail)
+                    if scan and scan.group(1) not in EXPECTED_SCANS.get(label, ()):
+                        failures.append(f'{label}: {detail} in {sql}')
+                    elif detail.startswith(TEMP_SORT):
+                        self.stdout.write(self.style.WARNING(f'  {detail} in {sql[:120]}'))
+        return failures
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from library.exports import EXPORT_FORMATS, EXPORT_STATUSES, export_borrow_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream borrow history as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--since', help='First borrow date to include (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last borrow date to include (YYYY-MM-DD)')
+        parser.add_argument('--status', choices=EXPORT_STATUSES, default='all')
+        parser.add_argument('--archived', action='store_true', help='Include loans moved out by archive_borrows')
+        parser.add_argument('--output', '-o', help='Write to this file instead of stdout')
+
+    def _date(self, options, name):
+        value = options[name]
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+        return day
+
+    def handle(self, *args, **options):
+        since = self._date(options, 'since')
+        until = self._date(options, 'until')
+        render, _ = EXPORT_FORMATS[options['format']]
+        exported = 0
+
+        def counted(rows):
+            nonlocal exported
+            for row in rows:
+                exported += 1
+                yield row
+
+        rows = counted(export_borrow_rows(since, until, options['status'], archived=options['archived']))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+                for line in render(rows):
+                    out.write(line)
+            self.stdout.write(self.style.SUCCESS(f'Exported {exported} borrow records to {options["output"]}'))
+        else:
+            for line in render(rows):
+                self.stdout.write(line, ending='')
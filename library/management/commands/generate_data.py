@@ -0,0 +1,250 @@
+import random
+import time
+from bisect import bisect
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from library.models import (
+    ArchivedBorrow, Book, BookDailyLoans, Borrow, Hold, Member, MemberMonthlyLoans, RollupCheckpoint, loan_period,
+)
+from library.stats import invalidate_borrow_stats, invalidate_member_stats
+from library.utils import create_default_groups
+from library.versions import CATALOG, bump_version
+
+
+USERNAME_PREFIX = 'synthetic-'
+DEFAULT_PASSWORD = 'member123'
+
+FIRST_NAMES = ['Ada', 'Alan', 'Grace', 'Linus', 'Margaret', 'Dennis', 'Barbara', 'Ken', 'Frances', 'Edsger',
+               'Radia', 'Donald', 'Hedy', 'John', 'Katherine', 'Tim', 'Sophie', 'Niklaus', 'Joan', 'Guido']
+LAST_NAMES = ['Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Hamilton', 'Ritchie', 'Liskov', 'Thompson', 'Allen',
+              'Dijkstra', 'Perlman', 'Knuth', 'Lamarr', 'McCarthy', 'Johnson', 'Berners-Lee', 'Wilson', 'Wirth']
+TITLE_WORDS = ['Shadow', 'River', 'Garden', 'Empire', 'Winter', 'Silent', 'Golden', 'Lost', 'Hidden', 'Iron',
+               'Glass', 'Storm', 'Night', 'Ocean', 'Paper', 'Crown', 'Echo', 'Harbor', 'Stone', 'Ember']
+
+
+def _isbn13(n):
+    digits = f'979{n:09d}'
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic dataset for load and benchmark testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--members', type=int, default=5000)
+        parser.add_argument('--loans', type=int, default=100000)
+        parser.add_argument('--librarians', type=int, default=5)
+        parser.add_argument('--years', type=int, default=3, help='Spread loans over this many years of history')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skew', type=float, default=0.8,
+                            help='Zipf exponent for book and member popularity (0 = uniform)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete all books, members, borrows and synthetic users first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if min(options['books'], options['members']) < 1 and options['loans']:
+            raise CommandError('Loans need at least one book and one member')
+
+        if options['flush']:
+            self._flush()
+        elif User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Synthetic data already exists; rerun with --flush to replace it')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            librarian_group, member_group = create_default_groups()
+            self._step('librarians', lambda: self._create_users(
+                options['librarians'], 'librarian', librarian_group, is_staff=True))
+            member_users = self._step('member users', lambda: self._create_users(
+                options['members'], 'member', member_group))
+            books = self._step('books', lambda: self._create_books(options['books']))
+            members = self._step('members', lambda: self._create_members(member_users))
+            self._step('loans', lambda: self._create_loans(
+                options['loans'], books, members, options['years'], options['skew']))
+        invalidate_borrow_stats()
+        invalidate_member_stats()
+        bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset in {time.monotonic() - started:.1f}s'))
+
+    def _step(self, label, func):
+        started = time.monotonic()
+        result = func()
+        self.stdout.write(f'  {label}: {time.monotonic() - started:.1f}s')
+        return result
+
+    def _flush(self):
+        self.stdout.write('Flushing existing library data...')
+        # Plain DELETEs: the ORM would load every row to send delete signals.
+        # Tables referencing Member and Book go first; one transaction, so a
+        # failure leaves the old data in place.
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (
+                BookDailyLoans, MemberMonthlyLoans, RollupCheckpoint, Hold, ArchivedBorrow, Borrow, Member, Book,
+            ):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def _create_users(self, count, role, group, is_staff=False):
+        # One hash for every synthetic account keeps generation fast and
+        # still lets benchmarks log in as any of them.
+        password = make_password(DEFAULT_PASSWORD)
+        users = []
+        for i in range(count):
+            first = self.rng.choice(FIRST_NAMES)
+            last = self.rng.choice(LAST_NAMES)
+            users.append(User(
+                username=f'{USERNAME_PREFIX}{role}-{i}',
+                first_name=first,
+                last_name=last,
+                email=f'{role}{i}@synthetic.example.com',
+                password=password,
+                is_staff=is_staff,
+            ))
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        users = list(User.objects.filter(username__startswith=f'{USERNAME_PREFIX}{role}-').order_by('id'))
+        memberships = [User.groups.through(user_id=user.id, group_id=group.id) for user in users]
+        User.groups.through.objects.bulk_create(memberships, batch_size=self.batch_size)
+        return users
+
+    def _create_books(self, count):
+        now = timezone.now()
+        books = []
+        for i in range(count):
+            words = self.rng.sample(TITLE_WORDS, self.rng.randint(1, 3))
+            books.append(Book(
+                title=f'The {" ".join(words)} {i}',
+                author=f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                isbn=_isbn13(i),
+                available_copies=self.rng.randint(1, 5),
+                added_date=now - timedelta(days=self.rng.randint(0, 3650)),
+            ))
+        Book.objects.bulk_create(books, batch_size=self.batch_size)
+        return list(Book.objects.order_by('id').values_list('id', 'available_copies'))
+
+    def _create_members(self, users):
+        today = timezone.localdate()
+        members = [
+            Member(
+                user_id=user.id,
+                name=f'{user.first_name} {user.last_name}',
+                email=user.email,
+                joined_date=today - timedelta(days=self.rng.randint(0, 3650)),
+            )
+            for user in users
+        ]
+        Member.objects.bulk_create(members, batch_size=self.batch_size)
+        return list(Member.objects.order_by('id').values_list('id', flat=True))
+
+    def _zipf_weights(self, count, skew):
+        ranks = list(range(1, count + 1))
+        self.rng.shuffle(ranks)
+        return list(accumulate(1.0 / rank ** skew for rank in ranks))
+
+    def _create_loans(self, count, books, members, years, skew):
+        if not count:
+            return
+        now = timezone.now()
+        span = years * 365 * 86400
+        book_weights = self._zipf_weights(len(books), skew)
+        member_weights = self._zipf_weights(len(members), skew)
+        book_total, member_total = book_weights[-1], member_weights[-1]
+        copies = {book_id: stock for book_id, stock in books}
+        on_loan = dict.fromkeys(copies, 0)
+        book_loans = Counter()
+        member_loans = Counter()
+        member_open = Counter()
+        rng = self.rng
+
+        # Plain executemany() of pre-adapted tuples: building a million Borrow
+        # instances for bulk_create() costs more than the inserts themselves.
+        fields = [
+            Borrow._meta.get_field(name)
+            for name in ('book', 'member', 'borrow_date', 'due_date', 'return_date', 'returned', 'overdue')
+        ]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(Borrow._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        # Naive UTC timestamps as text, the form Django itself stores
+        utc_now = timezone.make_naive(now, dt_timezone.utc) if timezone.is_aware(now) else now
+
+        # Generated oldest-first so ids follow borrow dates like real history
+        offsets = sorted((rng.random() * span for _ in range(count)), reverse=True)
+        random = rng.random
+        period = loan_period()
+        period_seconds = period.total_seconds()
+        batch = []
+        # Keeping a dozen secondary indexes up to date row by row costs far
+        # more than building each once over the loaded table, so they are
+        # dropped and recreated from their own SQL. The DDL is part of the
+        # surrounding transaction, so a failed run keeps its indexes.
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+                [Borrow._meta.db_table],
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX {quote(name)}')
+            for offset in offsets:
+                book_id = books[bisect(book_weights, random() * book_total)][0]
+                member_id = members[bisect(member_weights, random() * member_total)]
+                loan_seconds = 86400 + random() * 45 * 86400
+                returned = offset > loan_seconds or on_loan[book_id] >= copies[book_id]
+                borrow_date = utc_now - timedelta(seconds=offset)
+                if returned:
+                    return_date = (borrow_date + timedelta(seconds=min(loan_seconds, offset))).isoformat(' ')
+                else:
+                    on_loan[book_id] += 1
+                    member_open[member_id] += 1
+                    return_date = None
+                book_loans[book_id] += 1
+                member_loans[member_id] += 1
+                due_date = (borrow_date + period).isoformat(' ')
+                # Flagged as scan_overdue would have: kept past the due date
+                overdue = (min(loan_seconds, offset) if returned else offset) > period_seconds
+                batch.append((book_id, member_id, borrow_date.isoformat(' '), due_date, return_date, returned, overdue))
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+            for _, index_sql in indexes:
+                cursor.execute(index_sql)
+
+        # Shelf stock is whatever is not out on loan; the loan counters are
+        # written here because the raw inserts bypass library.circulation.
+        # Plain UPDATEs again: bulk_update() builds a CASE per row, which
+        # costs more than the loans themselves at this size.
+        with connection.cursor() as cursor:
+            self._update_rows(cursor, Book, ['available_copies', 'open_loans', 'total_loans'], [
+                (copies[book_id] - on_loan[book_id], on_loan[book_id], total, book_id)
+                for book_id, total in sorted(book_loans.items())
+            ])
+            self._update_rows(cursor, Member, ['open_loans', 'total_loans'], [
+                (member_open[member_id], total, member_id)
+                for member_id, total in sorted(member_loans.items())
+            ])
+
+    def _update_rows(self, cursor, model, columns, rows):
+        """Run ``UPDATE ... SET columns WHERE id`` for each ``(*values, id)`` in ``rows``"""
+        quote = connection.ops.quote_name
+        sql = 'UPDATE {} SET {} WHERE id = %s'.format(
+            quote(model._meta.db_table), ', '.join(f'{quote(column)} = %s' for column in columns),
+        )
+        for start in range(0, len(rows), self.batch_size):
+            cursor.executemany(sql, rows[start:start + self.batch_size])
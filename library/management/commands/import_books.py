@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from library.models import Book
+from library.versions import CATALOG, bump_version
+
+
+BOOK_UPDATE_FIELDS = ['title', 'author', 'available_copies']
+COPIES_ALIASES = ('available_copies', 'copies')
+PROGRESS_EVERY = 50000
+
+
+class RowError(ValueError):
+    """A record that cannot be imported; the message is written to the reject file"""
+
+
+def _isbn10_check_digit(digits):
+    total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def _isbn13_check_digit(digits):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value):
+    """Return the ISBN-13 form of ``value`` (hyphens/spaces removed, ISBN-10 converted)"""
+    isbn = ''.join(ch for ch in str(value or '') if ch.isalnum()).upper()
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == 'X'):
+        if _isbn10_check_digit(isbn) != isbn[9]:
+            raise RowError(f'bad ISBN-10 check digit: {value}')
+        isbn = '978' + isbn[:9]
+        return isbn + _isbn13_check_digit(isbn)
+    if len(isbn) == 13 and isbn.isdigit():
+        if _isbn13_check_digit(isbn) != isbn[12]:
+            raise RowError(f'bad ISBN-13 check digit: {value}')
+        return isbn
+    raise RowError(f'not an ISBN: {value!r}')
+
+
+def _text(record, key):
+    value = record.get(key)
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise RowError(f'{key} is not text: {value!r}')
+    return value.strip()
+
+
+def build_book(record):
+    """Validate one input record and return an unsaved Book"""
+    title = _text(record, 'title')
+    author = _text(record, 'author')
+    if not title:
+        raise RowError('missing title')
+    if not author:
+        raise RowError('missing author')
+    title_max = Book._meta.get_field('title').max_length
+    author_max = Book._meta.get_field('author').max_length
+    if len(title) > title_max or len(author) > author_max:
+        raise RowError('title or author too long')
+    copies = next((record[key] for key in COPIES_ALIASES if record.get(key) not in (None, '')), 0)
+    try:
+        copies = int(copies)
+    except (TypeError, ValueError):
+        raise RowError(f'bad copy count: {copies!r}')
+    if copies < 0:
+        raise RowError(f'negative copy count: {copies}')
+    return Book(title=title, author=author, isbn=normalize_isbn(record.get('isbn')), available_copies=copies)
+
+
+def read_csv(stream):
+    return csv.DictReader(stream)
+
+
+def read_jsonl(stream):
+    return (line for line in stream if line.strip())
+
+
+def parse_jsonl(line):
+    try:
+        record = json.loads(line)
+    except ValueError as exc:
+        raise RowError(f'invalid JSON: {exc}')
+    if not isinstance(record, dict):
+        raise RowError('record is not an object')
+    return record
+
+
+class Command(BaseCommand):
+    help = 'Stream books from CSV or JSON Lines into the catalog, upserting on ISBN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['auto', 'csv', 'jsonl'], default='auto',
+                            help='Input format (default: guess from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per INSERT ... ON CONFLICT batch')
+        parser.add_argument('--rejects', help='Write rejected rows to this CSV file')
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        path = options['path']
+        if fmt == 'auto':
+            fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        try:
+            if path == '-':
+                stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+            else:
+                stream = open(path, encoding='utf-8', newline='')
+        except OSError as exc:
+            raise CommandError(f'Cannot open {path}: {exc}')
+
+        rejects_file = None
+        if options['rejects']:
+            try:
+                rejects_file = open(options['rejects'], 'w', encoding='utf-8', newline='')
+            except OSError as exc:
+                if path != '-':
+                    stream.close()
+                raise CommandError(f"Cannot open {options['rejects']}: {exc}")
+        rejects = csv.writer(rejects_file) if rejects_file else None
+        if rejects:
+            rejects.writerow(['row', 'error', 'record'])
+
+        started = time.monotonic()
+        imported = rejected = 0
+        next_report = PROGRESS_EVERY
+        try:
+            if fmt == 'jsonl':
+                records, parse = read_jsonl(stream), parse_jsonl
+            else:
+                records, parse = read_csv(stream), dict
+            numbered = enumerate(records, start=1)
+            while True:
+                chunk = list(islice(numbered, options['batch_size']))
+                if not chunk:
+                    break
+                # Last occurrence of an ISBN within a batch wins
+                batch = {}
+                for row_number, raw in chunk:
+                    try:
+                        book = build_book(parse(raw))
+                    except RowError as exc:
+                        rejected += 1
+                        if rejects:
+                            rejects.writerow([row_number, str(exc), raw if isinstance(raw, str) else json.dumps(raw)])
+                        continue
+                    batch[book.isbn] = book
+                Book.objects.bulk_create(
+                    batch.values(),
+                    update_conflicts=True,
+                    unique_fields=['isbn'],
+                    update_fields=BOOK_UPDATE_FIELDS,
+                )
+                imported += len(batch)
+                if imported >= next_report:
+                    next_report += PROGRESS_EVERY
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f'{imported} rows imported ({imported / elapsed:.0f} rows/s)')
+        finally:
+            if path != '-':
+                stream.close()
+            if rejects_file:
+                rejects_file.close()
+            # bulk_create() sends no post_save, so API ETags and cached tables
+            # are moved on here, even when a later batch failed: every batch
+            # before it is already committed
+            if imported:
+                bump_version(CATALOG)
+
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else imported
+        self.stdout.write(
+            self.style.SUCCESS(f'Imported {imported} books in {elapsed:.1f}s ({rate:.0f} rows/s)')
+        )
+        if rejected:
+            where = f", see {options['rejects']}" if options['rejects'] else ''
+            self.stdout.write(self.style.WARNING(f'Rejected {rejected} rows{where}'))
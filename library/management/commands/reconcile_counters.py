@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from library.circulation import reconcile_loan_counters
+from library.models import Book, Member
+
+
+class Command(BaseCommand):
+    help = 'Recompute the open/total loan counters on books and members and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with an error if any counter had drifted (implies --dry-run)')
+
+    def handle(self, *args, **options):
+        fix = not (options['dry_run'] or options['check'])
+        drift = {}
+        with transaction.atomic():
+            for model in (Book, Member):
+                drift[model._meta.verbose_name_plural] = reconcile_loan_counters(model, fix=fix)
+
+        verb = 'fixed' if fix else 'found'
+        for label, count in drift.items():
+            self.stdout.write(f'{label}: {count} drifted rows {verb}')
+        total = sum(drift.values())
+        if options['check'] and total:
+            raise CommandError(f'{total} rows have drifted loan counters')
+        self.stdout.write(self.style.SUCCESS('Counters reconciled' if fix else 'Check complete'))
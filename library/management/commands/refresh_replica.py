@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from library.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database over the replica with the SQLite backup API; '
+            'a local stand-in for streaming replication')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep refreshing every N seconds (default: copy once and exit)')
+
+    def handle(self, *args, **options):
+        if REPLICA not in connections.databases:
+            raise CommandError('No replica database configured; set LIBRARY_REPLICA_PATH')
+        for alias in (DEFAULT_DB_ALIAS, REPLICA):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'The {alias} database is not SQLite; use real replication instead')
+        source = str(connections.databases[DEFAULT_DB_ALIAS]['NAME'])
+        target = str(connections.databases[REPLICA]['NAME'])
+
+        while True:
+            started = time.perf_counter()
+            pages = self._copy(source, target)
+            self.stdout.write(f'Replica refreshed: {pages} pages in {(time.perf_counter() - started) * 1000:.1f}ms')
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
+
+    def _copy(self, source, target):
+        """Snapshot ``source`` into a scratch file, then swap it in atomically.
+
+        Readers that opened the old replica keep reading it until they
+        reconnect; new connections see the new copy, never a half-written one.
+        """
+        scratch = f'{target}.refresh'
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(scratch)
+        try:
+            # One step copies a consistent snapshot; writers wait for its read lock
+            src.backup(dst)
+            pages = dst.execute('PRAGMA page_count').fetchone()[0]
+            # The copy inherits the primary's journal mode; readers of a
+            # swapped-in file must not need -wal/-shm files beside it
+            dst.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            dst.close()
+            src.close()
+        os.replace(scratch, target)
+        return pages
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from library.rollups import ROLLUP_BATCH_SIZE, rebuild_rollups, refresh_rollups, rollup_checkpoint
+
+
+class Command(BaseCommand):
+    help = ('Fold the borrows and returns since the last run into the daily/monthly rollup tables '
+            'behind the reports page; run it from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE,
+                            help=f'New borrows counted per transaction (default: {ROLLUP_BATCH_SIZE})')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Empty the rollups and count the whole borrow table again')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        refresh = rebuild_rollups if options['rebuild'] else refresh_rollups
+        started = time.perf_counter()
+        borrows, returns = refresh(options['batch_size'])
+        checkpoint = rollup_checkpoint()
+        self.stdout.write(
+            f'Folded {borrows} borrows and {returns} returns in {time.perf_counter() - started:.2f}s; '
+            f'rollups now cover borrow #{checkpoint.last_borrow_id} and returns through '
+            f'{checkpoint.returns_through:%Y-%m-%d %H:%M:%S}'
+        )
+        self.stdout.write(self.style.SUCCESS('Rollups refreshed'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from library.circulation import OVERDUE_CHUNK_SIZE, flag_overdue_loans, overdue_loans
+
+
+class Command(BaseCommand):
+    help = 'Flag open loans that are past their due date, then count them and list the most overdue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=OVERDUE_CHUNK_SIZE,
+                            help=f'Loans flagged per UPDATE (default: {OVERDUE_CHUNK_SIZE})')
+        parser.add_argument('--list', type=int, default=20, metavar='N',
+                            help='List the N most overdue loans (default: 20; 0 to skip)')
+        parser.add_argument('--dry-run', action='store_true', help='Count and list without flagging')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['list'] < 0:
+            raise CommandError('--chunk-size must be positive and --list not negative')
+        # One cutoff for the whole run, so the count matches what was flagged
+        now = timezone.now()
+
+        if not options['dry_run']:
+            flagged = flag_overdue_loans(now, options['chunk_size'])
+            self.stdout.write(f'Newly flagged: {flagged}')
+        overdue = overdue_loans(now)
+        self.stdout.write(f'Overdue loans: {overdue.count()}')
+
+        if options['list']:
+            rows = (
+                overdue.values_list('id', 'due_date', 'member__name', 'member__email', 'book__title')[:options['list']]
+            )
+            for borrow_id, due_date, name, email, title in rows:
+                days = (now - due_date).days
+                self.stdout.write(f'#{borrow_id}  due {due_date:%Y-%m-%d}  {days:4d} days over  {name} <{email}>  {title}')
+        self.stdout.write(self.style.SUCCESS('Overdue scan complete'))
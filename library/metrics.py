@@ -0,0 +1,173 @@
+"""In-process request metrics for the library views.
+
+Histograms live in the memory of each worker process, so with several
+gunicorn workers every process reports its own share of the traffic.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+# Prometheus metric name, help text, buckets, RequestTimings attribute
+METRICS = [
+    ('library_request_duration_seconds', 'Wall time spent handling the request', SECONDS_BUCKETS, 'wall'),
+    ('library_db_duration_seconds', 'Time spent executing SQL', SECONDS_BUCKETS, 'db'),
+    ('library_db_queries', 'SQL queries executed', QUERY_BUCKETS, 'queries'),
+    ('library_template_duration_seconds', 'Time spent rendering templates', SECONDS_BUCKETS, 'template'),
+    ('library_auth_duration_seconds', 'Time spent resolving user roles', SECONDS_BUCKETS, 'auth'),
+]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition shape"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, view, timings):
+        with self._lock:
+            for name, _, buckets, attr in METRICS:
+                key = (name, view)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(buckets)
+                histogram.observe(getattr(timings, attr))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Return every histogram in Prometheus text exposition format 0.0.4"""
+        lines = []
+        with self._lock:
+            for name, help_text, _, _ in METRICS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, view), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {histogram.total}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.total}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class RequestTimings:
+    """Accumulates the cost of one request; durations are in seconds"""
+
+    __slots__ = ('wall', 'db', 'queries', 'template', 'auth', '_template_depth')
+
+    def __init__(self):
+        self.wall = self.db = self.template = self.auth = 0.0
+        self.queries = 0
+        self._template_depth = 0
+
+    def server_timing(self):
+        return ', '.join([
+            f'app;dur={self.wall * 1000:.2f}',
+            f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template * 1000:.2f}',
+            f'auth;dur={self.auth * 1000:.2f}',
+        ])
+
+
+_current = ContextVar('library_request_timings', default=None)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Make a fresh RequestTimings current for the duration of the block"""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(attr):
+    """Add the block's duration to ``attr`` of the current request, if any"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, attr, getattr(timings, attr) + time.perf_counter() - started)
+
+
+def query_timer(execute, sql, params, many, context):
+    """connection.execute_wrapper() hook counting queries and SQL time"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+
+
+_template_timer_installed = False
+
+
+def install_template_timer():
+    """Wrap the Django template backend's render() to time top-level renders"""
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def render(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None or timings._template_depth:
+            return original_render(self, *args, **kwargs)
+        timings._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, *args, **kwargs)
+        finally:
+            timings._template_depth -= 1
+            timings.template += time.perf_counter() - started
+
+    Template.render = render
+    _template_timer_installed = True
@@ -0,0 +1,89 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import REGISTRY, collect, install_template_timer
+from .routers import PIN_COOKIE, pin_to_primary, replica_configured, routing
+
+
+class RequestMetricsMiddleware:
+    """Time library views and report SQL, template and role-lookup cost.
+
+    Each request routed through ``library.urls`` gets a ``Server-Timing``
+    header and is added to the in-process histograms served by the metrics
+    view. The middleware runs natively under WSGI and ASGI so it never
+    forces async views through a sync thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_template_timer()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with collect() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with collect() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, started)
+
+    def _finish(self, request, response, timings, started):
+        timings.wall = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.namespace == 'library':
+            REGISTRY.record(match.url_name, timings)
+            response['Server-Timing'] = timings.server_timing()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Decide per request whether library reads may go to the replica.
+
+    Views marked ``@replica_reads`` read from the replica unless the browser
+    carries the pin cookie. Any write to the primary keeps the rest of the
+    request on the primary and sets the pin, so the next pages show it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with routing() as state:
+            request.db_routing = state
+            response = self.get_response(request)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        with routing() as state:
+            request.db_routing = state
+            response = await self.get_response(request)
+        return self._finish(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_reads', False) and PIN_COOKIE not in request.COOKIES:
+            request.db_routing.use_replica = True
+
+    def _finish(self, response, state):
+        if state.wrote and replica_configured():
+            pin_to_primary(response)
+        return response
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+FTS_TABLE = 'library_book_fts'
+
+CREATE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, author, isbn, tokenize='unicode61 remove_diacritics 2')",
+    f"INSERT INTO {FTS_TABLE}(rowid, title, author, isbn) SELECT id, title, author, isbn FROM library_book",
+    f"""CREATE TRIGGER library_book_fts_insert AFTER INSERT ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn) VALUES (new.id, new.title, new.author, new.isbn);
+    END""",
+    f"""CREATE TRIGGER library_book_fts_delete AFTER DELETE ON library_book BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER library_book_fts_update AFTER UPDATE OF title, author, isbn ON library_book BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn) VALUES (new.id, new.title, new.author, new.isbn);
+    END""",
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS library_book_fts_update',
+    'DROP TRIGGER IF EXISTS library_book_fts_delete',
+    'DROP TRIGGER IF EXISTS library_book_fts_insert',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def _run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other backends fall back to ORM filtering in library.search
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_member_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'title'], name='book_author_idx'),
+        ),
+        migrations.RunPython(_run_on_sqlite(CREATE_FTS_SQL), _run_on_sqlite(DROP_FTS_SQL)),
+    ]
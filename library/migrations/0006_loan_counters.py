@@ -0,0 +1,51 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:49
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Borrow = apps.get_model('library', 'Borrow')
+    for model_name, field in (('Book', 'book'), ('Member', 'member')):
+        def loans(**filters):
+            borrows = (
+                Borrow.objects.filter(**{field: OuterRef('pk')}, **filters)
+                .order_by().values(field).annotate(count=Count('id')).values('count')
+            )
+            return Coalesce(Subquery(borrows, output_field=IntegerField()), Value(0))
+        apps.get_model('library', model_name).objects.update(
+            open_loans=loans(returned=False),
+            total_loans=loans(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_borrow_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='open_loans',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_loans',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='open_loans',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='total_loans',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.11 on 2026-10-18 03:11
+
+from datetime import timedelta
+
+import library.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_due_dates(apps, schema_editor):
+    # Existing loans were made under the default period
+    Borrow = apps.get_model('library', 'Borrow')
+    Borrow.objects.update(due_date=F('borrow_date') + timedelta(days=settings.LIBRARY_LOAN_DAYS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_borrow_access_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='loan_period_days',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='borrow',
+            name='due_date',
+            field=models.DateTimeField(default=library.models.default_due_date),
+        ),
+        migrations.AddField(
+            model_name='borrow',
+            name='overdue',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_due_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['due_date'], name='borrow_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('overdue', False), ('returned', False)), fields=['due_date'], name='borrow_unflagged_due_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.11 on 2026-10-18 03:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookDailyLoans',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MemberMonthlyLoans',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_borrow_id', models.BigIntegerField(default=0)),
+                ('returns_through', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['return_date'], name='borrow_return_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookdailyloans',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_loans', to='library.book'),
+        ),
+        migrations.AddField(
+            model_name='membermonthlyloans',
+            name='member',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_loans', to='library.member'),
+        ),
+        migrations.AddIndex(
+            model_name='bookdailyloans',
+            index=models.Index(fields=['day', 'book'], name='book_daily_loans_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookdailyloans',
+            constraint=models.UniqueConstraint(fields=('book', 'day'), name='book_daily_loans_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='membermonthlyloans',
+            index=models.Index(fields=['month', 'member'], name='member_monthly_loans_month_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='membermonthlyloans',
+            constraint=models.UniqueConstraint(fields=('member', 'month'), name='member_monthly_loans_unique'),
+        ),
+    ]
@@ -1,8 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 
 
+def loan_period(book=None):
+    """How long ``book`` may be kept: its own loan period or the library default"""
+    days = book.loan_period_days if book is not None and book.loan_period_days else settings.LIBRARY_LOAN_DAYS
+    return timedelta(days=days)
+
+
+def default_due_date():
+    return timezone.now() + loan_period()
+
+
 class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200)
@@ -10,12 +25,22 @@ class Book(models.Model):
     available_copies = models.PositiveIntegerField(default=0)
     added_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     added_date = models.DateTimeField(default=timezone.now)
+    # Overrides LIBRARY_LOAN_DAYS, e.g. for short-loan reference copies
+    loan_period_days = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Maintained by library.circulation; reconcile_counters repairs drift
+    open_loans = models.PositiveIntegerField(default=0, editable=False)
+    total_loans = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return f"{self.title} by {self.author}"
     
     class Meta:
         ordering = ['title']
+        indexes = [
+            # Back the sort orders offered by the paginated catalog
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+            models.Index(fields=['author', 'title'], name='book_author_idx'),
+        ]
 
 
 class Member(models.Model):
@@ -24,12 +49,20 @@ class Member(models.Model):
     email = models.EmailField(unique=True)
     joined_date = models.DateField(default=timezone.now)
     is_active = models.BooleanField(default=True)
+    # Maintained by library.circulation; reconcile_counters repairs drift
+    open_loans = models.PositiveIntegerField(default=0, editable=False)
+    total_loans = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return self.name
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Backs the case-insensitive prefix search in member_autocomplete
+            models.Index(Lower('name'), name='member_name_lower_idx'),
+            models.Index(Lower('email'), name='member_email_lower_idx'),
+        ]
 
 
 class Borrow(models.Model):
@@ -40,9 +73,161 @@ class Borrow(models.Model):
     return_date = models.DateTimeField(null=True, blank=True)
     returned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='returns_processed')
     returned = models.BooleanField(default=False)
+    due_date = models.DateTimeField(default=default_due_date)
+    # Set by scan_overdue once the loan passes its due date; kept after return
+    overdue = models.BooleanField(default=False)
     
     def __str__(self):
         return f"{self.member.name} borrowed {self.book.title}"
     
     class Meta:
         ordering = ['-borrow_date']
+        indexes = [
+            # Keyset cursor for the logs page: ORDER BY borrow_date DESC, id DESC
+            models.Index(fields=['-borrow_date', '-id'], name='borrow_date_id_idx'),
+            # Covers the logs summary counts (status and borrow date) so the
+            # aggregate reads this narrow index instead of every row
+            models.Index(fields=['returned', '-borrow_date'], name='borrow_returned_date_idx'),
+            # One member's history in my_borrows, newest first
+            models.Index(fields=['member', '-borrow_date'], name='borrow_member_date_idx'),
+            # Open loans only. Boolean filters compile to a bare NOT "returned",
+            # which a (returned, ...) index can't seek on, but a partial index
+            # with the same predicate can: unreturned logs in keyset order and
+            # unreturned exports in id order.
+            models.Index(fields=['-borrow_date', '-id'], condition=Q(returned=False), name='borrow_open_date_idx'),
+            models.Index(fields=['id'], condition=Q(returned=False), name='borrow_open_id_idx'),
+            # Open loans by due date: counting and listing overdue loans
+            models.Index(fields=['due_date'], condition=Q(returned=False), name='borrow_open_due_idx'),
+            # Open loans not yet flagged: scan_overdue only ever reads the ones
+            # it has to flag, since flagged rows drop out of this index
+            models.Index(fields=['due_date'], condition=Q(returned=False, overdue=False), name='borrow_unflagged_due_idx'),
+            # Lets refresh_rollups find the returns since its last run
+            models.Index(fields=['return_date'], name='borrow_return_date_idx'),
+        ]
+
+
+class ArchivedBorrow(models.Model):
+    """A returned loan moved out of Borrow by archive_borrows.
+
+    Same columns and ids as Borrow, so archived rows can be listed and
+    exported next to live ones; the live table keeps only current activity.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_borrows')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='archived_borrows')
+    borrowed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    borrow_date = models.DateTimeField()
+    return_date = models.DateTimeField(null=True, blank=True)
+    returned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    returned = models.BooleanField(default=True)
+    due_date = models.DateTimeField()
+    overdue = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.member.name} borrowed {self.book.title} (archived)"
+    
+    class Meta:
+        indexes = [
+            # The same keyset and per-member orders as the live table
+            models.Index(fields=['-borrow_date', '-id'], name='archived_date_id_idx'),
+            models.Index(fields=['member', '-borrow_date'], name='archived_member_date_idx'),
+        ]
+
+
+class Hold(models.Model):
+    """A member's place in the queue for a book with no copy on the shelf.
+
+    Returns hand the copy to the oldest waiting hold (see
+    library.circulation); the copy then stays off the shelf until that
+    member borrows it or the hold is cancelled.
+    """
+
+    WAITING = 'waiting'
+    READY = 'ready'
+    FULFILLED = 'fulfilled'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (WAITING, 'Waiting'),
+        (READY, 'Ready for pickup'),
+        (FULFILLED, 'Fulfilled'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    ACTIVE = (WAITING, READY)
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='holds')
+    requested_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.member.name} holds {self.book.title} ({self.status})"
+    
+    class Meta:
+        ordering = ['requested_at', 'id']
+        indexes = [
+            # The queue: a return seeks straight to a book's oldest waiting
+            # hold however many holds the title has
+            models.Index(fields=['book', 'requested_at', 'id'], condition=Q(status='waiting'), name='hold_queue_idx'),
+            # A member's own holds in my_borrows and at pickup
+            models.Index(fields=['member', 'status'], name='hold_member_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book', 'member'], condition=Q(status__in=['waiting', 'ready']), name='hold_one_active_per_member',
+            ),
+        ]
+
+
+class BookDailyLoans(models.Model):
+    """Borrows and returns of one book on one day; maintained by refresh_rollups"""
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_loans')
+    day = models.DateField()
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'day'], name='book_daily_loans_unique'),
+        ]
+        indexes = [
+            # Reports read a date range across all books
+            models.Index(fields=['day', 'book'], name='book_daily_loans_day_idx'),
+        ]
+
+
+class MemberMonthlyLoans(models.Model):
+    """Borrows and returns of one member in one month; maintained by refresh_rollups"""
+
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='monthly_loans')
+    # First day of the month
+    month = models.DateField()
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'month'], name='member_monthly_loans_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['month', 'member'], name='member_monthly_loans_month_idx'),
+        ]
+
+
+class RollupCheckpoint(models.Model):
+    """How far the rollup tables have counted the borrow table.
+
+    Every borrow with ``id <= last_borrow_id`` is counted, and so is its
+    return if it happened at or before ``returns_through``.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    last_borrow_id = models.BigIntegerField(default=0)
+    returns_through = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} through borrow #{self.last_borrow_id}"
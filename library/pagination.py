@@ -0,0 +1,173 @@
+import base64
+import json
+from functools import reduce
+from itertools import chain
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor from the query string cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of keyset-paginated rows plus the cursors either side of it"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """Cursor pagination over a unique ordered key (never uses OFFSET or COUNT).
+
+    ``ordering`` is a tuple of field names, e.g. ``('-borrow_date', '-id')``
+    or ``('-available_copies', 'title', 'id')``; the last field must be
+    unique so every row has a distinct position.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.descending = [name.startswith('-') for name in ordering]
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.per_page = per_page
+
+    def encode_cursor(self, obj):
+        # isoformat() keeps full microsecond precision, which the keyset
+        # comparison needs (DjangoJSONEncoder truncates to milliseconds)
+        values = [getattr(obj, field) for field in self.fields]
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        raw = json.dumps(values).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            opts = self.queryset.model._meta
+            return [opts.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def _after(self, values, forward):
+        # Lexicographic (a, b) > (x, y) expanded as a > x OR (a = x AND b > y),
+        # each field compared in its own direction
+        clauses = []
+        for i, field in enumerate(self.fields):
+            terms = {name: values[j] for j, name in enumerate(self.fields[:i])}
+            lookup = 'lt' if self.descending[i] == forward else 'gt'
+            terms[f'{field}__{lookup}'] = values[i]
+            clauses.append(Q(**terms))
+        return reduce(or_, clauses)
+
+    def _preceding(self, before, queryset=None):
+        queryset = self.queryset if queryset is None else queryset
+        reverse = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering)
+        return (
+            queryset.filter(self._after(self.decode_cursor(before), forward=False))
+            .order_by(*reverse)[:self.per_page + 1]
+        )
+
+    def _preceding_page(self, rows):
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]),
+            previous_cursor=self.encode_cursor(rows[0]),
+        )
+
+    def _following(self, after, queryset=None):
+        queryset = (self.queryset if queryset is None else queryset).order_by(*self.ordering)
+        if after:
+            queryset = queryset.filter(self._after(self.decode_cursor(after), forward=True))
+        return queryset[:self.per_page + 1]
+
+    def _following_page(self, rows, after):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if rows and has_more else None,
+            previous_cursor=self.encode_cursor(rows[0]) if rows and after else None,
+        )
+
+    def page(self, after=None, before=None):
+        """Return the page following ``after`` or preceding ``before`` (first page if neither)"""
+        if before:
+            rows = list(self._preceding(before))
+            if len(rows) <= self.per_page:
+                # Reached the start of the listing; show a full first page
+                return self.page()
+            return self._preceding_page(rows)
+        return self._following_page(list(self._following(after)), after)
+
+    async def apage(self, after=None, before=None):
+        """Async ORM counterpart of page()"""
+        if before:
+            rows = [row async for row in self._preceding(before)]
+            if len(rows) <= self.per_page:
+                return await self.apage()
+            return self._preceding_page(rows)
+        return self._following_page([row async for row in self._following(after)], after)
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """KeysetPaginator over several querysets sharing the ordering fields, e.g. live and archived rows.
+
+    Each page reads at most ``per_page + 1`` rows from every queryset and
+    merges them, so it costs one keyset query per source.
+    """
+
+    def __init__(self, querysets, ordering, per_page):
+        super().__init__(querysets[0], ordering, per_page)
+        if len(set(self.descending)) != 1:
+            raise ValueError('Merged keyset ordering fields must all sort in the same direction')
+        self.querysets = querysets
+
+    def _merge(self, sources, forward):
+        # Rows come back in page order going forward and reversed going back
+        reverse = self.descending[0] == forward
+        rows = sorted(chain(*sources), key=lambda row: [getattr(row, field) for field in self.fields], reverse=reverse)
+        return rows[:self.per_page + 1]
+
+    def page(self, after=None, before=None):
+        if before:
+            rows = self._merge([list(self._preceding(before, queryset)) for queryset in self.querysets], forward=False)
+            if len(rows) <= self.per_page:
+                return self.page()
+            return self._preceding_page(rows)
+        rows = self._merge([list(self._following(after, queryset)) for queryset in self.querysets], forward=True)
+        return self._following_page(rows, after)
+
+    async def apage(self, after=None, before=None):
+        sources = []
+        for queryset in self.querysets:
+            rows = self._preceding(before, queryset) if before else self._following(after, queryset)
+            sources.append([row async for row in rows])
+        if before:
+            rows = self._merge(sources, forward=False)
+            if len(rows) <= self.per_page:
+                return await self.apage()
+            return self._preceding_page(rows)
+        return self._following_page(self._merge(sources, forward=True), after)
+
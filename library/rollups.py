@@ -0,0 +1,149 @@
+"""Daily and monthly circulation rollups for the reports page.
+
+``refresh_rollups()`` folds the borrows and returns that happened since its
+last checkpoint into BookDailyLoans and MemberMonthlyLoans. It uses
+``INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE``, so the counting
+happens in the database. Each batch commits together with the checkpoint,
+which makes an interrupted refresh safe to re-run. Reports then read rows
+per day or month in the range asked for, however long the history is.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, DateField, Max, Sum, Value
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import ArchivedBorrow, BookDailyLoans, Borrow, MemberMonthlyLoans, RollupCheckpoint
+
+
+CHECKPOINT = 'circulation'
+ROLLUP_BATCH_SIZE = 50000
+# Returns newer than this are left for the next run, so one that is still
+# being committed when the refresh reads the table is not skipped for good
+ROLLUP_SETTLE = timedelta(minutes=1)
+
+
+def _day(field):
+    return TruncDate(field)
+
+
+def _month(field):
+    # Truncate the local date, not the UTC timestamp, so months match days
+    return TruncMonth(TruncDate(field), output_field=DateField())
+
+
+# (rollup model, grouping column, its key column, how to bucket a timestamp)
+ROLLUPS = (
+    (BookDailyLoans, 'book_id', 'day', _day),
+    (MemberMonthlyLoans, 'member_id', 'month', _month),
+)
+
+
+def _upsert(model, group, bucket, queryset, counted):
+    """Add the per-bucket counts of ``queryset`` to ``model``'s ``counted`` column"""
+    other = 'returns' if counted == 'borrows' else 'borrows'
+    select = (
+        queryset.order_by()
+        .values(group, bucket)
+        .annotate(**{counted: Count('id'), other: Value(0)})
+        .values_list(group, bucket, 'borrows', 'returns')
+    )
+    sql, params = select.query.sql_with_params()
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in (group, bucket, 'borrows', 'returns'))
+    column = connection.ops.quote_name(counted)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) {sql} '
+            f'ON CONFLICT ({connection.ops.quote_name(group)}, {connection.ops.quote_name(bucket)}) '
+            f'DO UPDATE SET {column} = {table}.{column} + excluded.{column}',
+            params,
+        )
+
+
+def _fold(queryset, counted):
+    """Add the borrows (``counted='borrows'``) or returns in ``queryset`` to every rollup"""
+    field = 'borrow_date' if counted == 'borrows' else 'return_date'
+    for model, group, bucket, truncate in ROLLUPS:
+        _upsert(model, group, bucket, queryset.annotate(**{bucket: truncate(field)}), counted)
+    return queryset.count()
+
+
+def refresh_rollups(batch_size=ROLLUP_BATCH_SIZE, now=None, settle=ROLLUP_SETTLE):
+    """Count every borrow and return since the checkpoint; return ``(borrows, returns)`` folded in.
+
+    Returns of loans already counted are found through the return_date
+    index. New loans are read in id batches, each committed with the
+    checkpoint. This relies on borrow ids becoming visible in order, which
+    SQLite's single writer guarantees.
+    """
+    through = (now or timezone.now()) - settle
+    checkpoint, _ = RollupCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    folded_borrows = folded_returns = 0
+
+    with transaction.atomic():
+        checkpoint = RollupCheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+        if checkpoint.returns_through is None or checkpoint.returns_through < through:
+            if checkpoint.returns_through is not None:
+                folded_returns += _fold(Borrow.objects.filter(
+                    id__lte=checkpoint.last_borrow_id,
+                    return_date__gt=checkpoint.returns_through,
+                    return_date__lte=through,
+                ), 'returns')
+            checkpoint.returns_through = through
+            checkpoint.save(update_fields=['returns_through', 'updated_at'])
+
+    last_id = Borrow.objects.aggregate(last=Max('id'))['last'] or 0
+    while checkpoint.last_borrow_id < last_id:
+        upper = min(checkpoint.last_borrow_id + batch_size, last_id)
+        with transaction.atomic():
+            batch = Borrow.objects.filter(id__gt=checkpoint.last_borrow_id, id__lte=upper)
+            folded_borrows += _fold(batch, 'borrows')
+            folded_returns += _fold(batch.filter(return_date__lte=checkpoint.returns_through), 'returns')
+            checkpoint.last_borrow_id = upper
+            checkpoint.save(update_fields=['last_borrow_id', 'updated_at'])
+    return folded_borrows, folded_returns
+
+
+def rebuild_rollups(batch_size=ROLLUP_BATCH_SIZE, now=None, settle=ROLLUP_SETTLE):
+    """Empty the rollups and count the whole borrow table and the archive again"""
+    with transaction.atomic():
+        BookDailyLoans.objects.all().delete()
+        MemberMonthlyLoans.objects.all().delete()
+        RollupCheckpoint.objects.filter(name=CHECKPOINT).delete()
+        # Only loans counted earlier were archived, and refresh only reads
+        # the live table, so the archive is folded in here once
+        folded_borrows = _fold(ArchivedBorrow.objects.all(), 'borrows')
+        folded_returns = _fold(ArchivedBorrow.objects.all(), 'returns')
+    borrows, returns = refresh_rollups(batch_size, now, settle)
+    return folded_borrows + borrows, folded_returns + returns
+
+
+def rollup_checkpoint():
+    return RollupCheckpoint.objects.filter(name=CHECKPOINT).first()
+
+
+def loans_per_day(start, end):
+    """``[{'day', 'borrows', 'returns'}]`` for each day in ``[start, end]`` with any activity"""
+    return list(
+        BookDailyLoans.objects.filter(day__range=(start, end))
+        .values('day').annotate(borrows=Sum('borrows'), returns=Sum('returns')).order_by('day')
+    )
+
+
+def most_borrowed(start, end, limit=10):
+    """The ``limit`` books borrowed most often between ``start`` and ``end``"""
+    return list(
+        BookDailyLoans.objects.filter(day__range=(start, end), borrows__gt=0)
+        .values('book_id', 'book__title', 'book__author')
+        .annotate(borrows=Sum('borrows')).order_by('-borrows', 'book__title')[:limit]
+    )
+
+
+def active_members_per_month(start, end):
+    """``[{'month', 'members', 'borrows'}]``: members who borrowed in each month of the range"""
+    return list(
+        MemberMonthlyLoans.objects.filter(month__range=(start.replace(day=1), end), borrows__gt=0)
+        .values('month').annotate(members=Count('member_id'), borrows=Sum('borrows')).order_by('month')
+    )
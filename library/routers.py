@@ -0,0 +1,99 @@
+"""Send the library's read-only views to a replica database.
+
+Views opt in with ``@replica_reads``; everything else, every write and any
+read that follows a write in the same request stays on the primary. After a
+request writes, ``ReplicaRoutingMiddleware`` pins that browser to the
+primary for ``REPLICA_MAX_LAG`` seconds so users always read their own
+writes. Without a ``replica`` alias in ``DATABASES`` everything runs on the
+primary.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA = 'replica'
+PIN_COOKIE = 'library_primary'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def replica_reads(view_func):
+    """Mark a view as read-only so its library queries may use the replica"""
+    view_func.replica_reads = True
+    return view_func
+
+
+def replica_configured():
+    return REPLICA in connections.databases
+
+
+class RoutingState:
+    """Per-request routing decision, shared with threads the request hops to"""
+
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+_current = ContextVar('library_db_routing', default=None)
+
+
+@contextmanager
+def routing():
+    """Make a fresh RoutingState current for the duration of the block"""
+    state = RoutingState()
+    token = _current.set(state)
+    try:
+        yield state
+    finally:
+        _current.reset(token)
+
+
+def write_detector(execute, sql, params, many, context):
+    """connection.execute_wrapper() hook noting that the request wrote to the primary"""
+    state = _current.get()
+    if state is not None and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def reading_from_replica():
+    state = _current.get()
+    return state is not None and state.use_replica and not state.wrote and replica_configured()
+
+
+def cache_timeout(timeout):
+    """Shorten ``timeout`` for values computed from the replica.
+
+    The replica may not have the change that invalidated the old value yet,
+    so whatever it returns must expire once it has caught up.
+    """
+    return min(timeout, settings.REPLICA_MAX_LAG) if reading_from_replica() else timeout
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Sessions, users and groups are small and must never lag a login
+        if model._meta.app_label == 'library' and reading_from_replica():
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same rows, so a book read from the replica
+        # can be attached to a borrow saved on the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is only ever a copy of the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+def pin_to_primary(response):
+    response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_MAX_LAG, httponly=True, samesite='Lax')
@@ -0,0 +1,79 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import Book, Member
+
+
+BOOK_FTS_TABLE = 'library_book_fts'
+
+# Sort keys accepted from the query string, mapped to ORM orderings
+BOOK_SORTS = {
+    'title': ('title', 'id'),
+    '-title': ('-title', '-id'),
+    'author': ('author', 'title', 'id'),
+    '-author': ('-author', '-title', '-id'),
+    'available': ('available_copies', 'title', 'id'),
+    '-available': ('-available_copies', 'title', 'id'),
+    'newest': ('-added_date', '-id'),
+}
+DEFAULT_BOOK_SORT = 'title'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Sorts after every string that starts with a given prefix
+_PREFIX_END = '\U0010ffff'
+
+
+def search_terms(query):
+    """Split a free-text query into lowercase word tokens"""
+    return [term.lower() for term in _TOKEN_RE.findall(query or '')]
+
+
+def has_book_fts():
+    """True when the FTS5 index over books is available on this database"""
+    return connection.vendor == 'sqlite'
+
+
+def fts_match_expression(terms):
+    """Build an FTS5 MATCH expression requiring every term as a prefix"""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_books(query, sort=DEFAULT_BOOK_SORT):
+    """Return a queryset of books matching every term of ``query`` by title, author or ISBN"""
+    books = Book.objects.all()
+    terms = search_terms(query)
+    if terms:
+        if has_book_fts():
+            books = books.filter(id__in=RawSQL(
+                f'SELECT rowid FROM {BOOK_FTS_TABLE} WHERE {BOOK_FTS_TABLE} MATCH %s',
+                (fts_match_expression(terms),),
+            ))
+        else:
+            for term in terms:
+                books = books.filter(
+                    Q(title__icontains=term) | Q(author__icontains=term) | Q(isbn__startswith=term)
+                )
+    return books.order_by(*BOOK_SORTS.get(sort, BOOK_SORTS[DEFAULT_BOOK_SORT]))
+
+
+def prefix_range(lookup, prefix):
+    """Q object matching values of ``lookup`` that start with ``prefix``.
+
+    Written as a >=/< range rather than LIKE so the database can walk an
+    index (SQLite never uses an index for LIKE ... ESCAPE).
+    """
+    return Q(**{f'{lookup}__gte': prefix, f'{lookup}__lt': prefix + _PREFIX_END})
+
+
+def search_members(term):
+    """Members whose name or email starts with ``term``, case-insensitively"""
+    term = term.strip().lower()
+    return (
+        Member.objects.annotate(name_lower=Lower('name'), email_lower=Lower('email'))
+        .filter(prefix_range('name_lower', term) | prefix_range('email_lower', term))
+    )
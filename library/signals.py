@@ -0,0 +1,70 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .metrics import query_timer
+from .models import Book, Borrow, Member
+from .routers import write_detector
+from .stats import invalidate_borrow_stats, invalidate_member_stats
+from .utils import bump_role_version
+from .versions import CATALOG, MEMBERS, bump_version
+
+
+def _bump_on_commit(scope):
+    # Bumping before commit would let a concurrent request cache the old
+    # rows under the new version
+    transaction.on_commit(lambda: bump_version(scope))
+
+
+@receiver(connection_created)
+def install_query_hooks(sender, connection, **kwargs):
+    # Connections are per thread and async views query from a worker thread,
+    # so hook every connection rather than the middleware's own
+    for hook in (query_timer, write_detector):
+        if hook not in connection.execute_wrappers:
+            connection.execute_wrappers.append(hook)
+
+
+@receiver([post_save, post_delete], sender=Borrow)
+def borrow_changed(sender, **kwargs):
+    invalidate_borrow_stats()
+    _bump_on_commit(CATALOG)
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, **kwargs):
+    _bump_on_commit(CATALOG)
+
+
+@receiver([post_save, post_delete], sender=Member)
+def member_changed(sender, instance, **kwargs):
+    invalidate_member_stats()
+    _bump_on_commit(MEMBERS)
+    # A member profile alone grants the member role
+    if instance.user_id:
+        bump_role_version([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # The cached user entry carries the password hash that sessions are checked against
+    bump_role_version([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action == 'pre_clear':
+            # group.user_set.clear() does not report pk_set; read members first
+            bump_role_version(instance.user_set.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            bump_role_version(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        bump_role_version([instance.pk])
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    bump_role_version(instance.user_set.values_list('pk', flat=True))
@@ -0,0 +1,108 @@
+from datetime import datetime, time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ArchivedBorrow, Borrow, Member
+from .routers import cache_timeout
+
+
+BORROW_STATS_KEY = 'library:stats:borrows'
+MEMBER_STATS_KEY = 'library:stats:members'
+STATS_TIMEOUT = 300
+
+
+def _start_of_today():
+    today = timezone.localdate()
+    return timezone.make_aware(datetime.combine(today, time.min))
+
+
+def _dated_key(key):
+    # The current date is part of the key so "today"/"this month" figures
+    # roll over at midnight even if nothing invalidates them.
+    return f'{key}:{timezone.localdate().isoformat()}'
+
+
+def _cached(key, compute):
+    dated_key = _dated_key(key)
+    stats = cache.get(dated_key)
+    if stats is None:
+        stats = compute()
+        cache.set(dated_key, stats, cache_timeout(STATS_TIMEOUT))
+    return stats
+
+
+async def _acached(key, compute):
+    dated_key = _dated_key(key)
+    stats = await cache.aget(dated_key)
+    if stats is None:
+        stats = await compute()
+        await cache.aset(dated_key, stats, cache_timeout(STATS_TIMEOUT))
+    return stats
+
+
+def _borrow_stats_aggregates():
+    return {
+        'total': Count('id'),
+        'unreturned': Count('id', filter=Q(returned=False)),
+        'returned': Count('id', filter=Q(returned=True)),
+        'today': Count('id', filter=Q(borrow_date__gte=_start_of_today())),
+    }
+
+
+def _add_archived(stats, archived):
+    # Archived loans are all returned and long past "today"
+    stats['total'] += archived
+    stats['returned'] += archived
+    return stats
+
+
+def _compute_borrow_stats():
+    return _add_archived(Borrow.objects.aggregate(**_borrow_stats_aggregates()), ArchivedBorrow.objects.count())
+
+
+async def _acompute_borrow_stats():
+    stats = await Borrow.objects.aaggregate(**_borrow_stats_aggregates())
+    return _add_archived(stats, await ArchivedBorrow.objects.acount())
+
+
+def _compute_member_stats():
+    first_of_month = timezone.localdate().replace(day=1)
+    return Member.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        new_this_month=Count('id', filter=Q(joined_date__gte=first_of_month)),
+    )
+
+
+def borrow_stats():
+    """Counts for the logs summary cards: total, unreturned, returned and borrowed today"""
+    return _cached(BORROW_STATS_KEY, _compute_borrow_stats)
+
+
+async def aborrow_stats():
+    """Async ORM counterpart of borrow_stats(), sharing its cache entry"""
+    return await _acached(BORROW_STATS_KEY, _acompute_borrow_stats)
+
+
+def member_stats():
+    """Counts for the members summary card: total, active and joined this month"""
+    return _cached(MEMBER_STATS_KEY, _compute_member_stats)
+
+
+def member_borrow_stats(member):
+    """Counts for one member's history cards, read from the maintained loan counters"""
+    return {
+        'total': member.total_loans,
+        'unreturned': member.open_loans,
+        'returned': member.total_loans - member.open_loans,
+    }
+
+
+def invalidate_borrow_stats():
+    cache.delete(_dated_key(BORROW_STATS_KEY))
+
+
+def invalidate_member_stats():
+    cache.delete(_dated_key(MEMBER_STATS_KEY))
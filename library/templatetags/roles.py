@@ -11,4 +11,4 @@ def is_librarian(user):
 
 @register.filter
 def is_member(user):
-	return _is_member(user) 
\ No newline at end of file
+	return _is_member(user)
@@ -1,3 +1,1043 @@
-from django.test import TestCase
+import csv
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import warnings
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .circulation import (
+    AlreadyReturned, BookUnavailable, cancel_hold, flag_overdue_loans, lend_book, overdue_loans, place_hold,
+    queue_position, receive_book, reconcile_loan_counters,
+)
+from .archive import archive_borrows
+from .models import ArchivedBorrow, Book, BookDailyLoans, Hold, Member, MemberMonthlyLoans, Borrow
+from .rollups import rebuild_rollups, refresh_rollups
+from .routers import PIN_COOKIE, REPLICA, ReplicaRouter, routing
+from .search import search_books
+from .stats import aborrow_stats
+from .urls import urlpatterns
+from .utils import aget_user_roles, create_default_groups, get_cached_user, get_user_roles
+from .versions import CATALOG, get_version
+from .views import book_paginator
+
+
+# Maximum SQL queries per request, independent of how many rows exist.
+# Keys are (role, url name); every name in library/urls.py must appear.
+QUERY_BUDGETS = {
+    ('anonymous', 'login'): 0,
+    ('anonymous', 'register'): 0,
+    ('member', 'logout'): 5,
+    ('librarian', 'home'): 3,
+    ('member', 'home'): 3,
+    ('librarian', 'book_list'): 4,
+    ('member', 'book_list'): 4,
+    ('librarian', 'add_book'): 3,
+    ('librarian', 'edit_book'): 4,
+    ('librarian', 'delete_book'): 4,
+    ('librarian', 'members'): 5,
+    ('librarian', 'member_autocomplete'): 4,
+    ('librarian', 'borrow_book'): 12,
+    ('librarian', 'return_book'): 10,
+    ('member', 'return_book'): 10,
+    ('librarian', 'logs'): 7,
+    ('librarian', 'export_logs'): 5,
+    ('librarian', 'my_borrows'): 3,
+    ('member', 'my_borrows'): 7,
+    ('librarian', 'reports'): 7,
+    ('librarian', 'metrics'): 3,
+    ('anonymous', 'api_books'): 1,
+    ('anonymous', 'api_book_detail'): 1,
+    ('anonymous', 'api_book_by_isbn'): 1,
+    ('anonymous', 'api_availability'): 1,
+}
+
+ADMIN_CHANGELIST_BUDGET = 10
+
+
+class QueryBudgetTests(TestCase):
+    """Each view must issue a fixed number of queries however many rows exist.
+
+    Every check runs against a small and a larger dataset: the count has to
+    match between the two and stay within the budget above.
+    """
+
+    SMALL = 3
+    LARGE = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, member_group = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw', is_staff=True, is_superuser=True)
+        cls.librarian.groups.add(librarian_group)
+        cls.member_user = User.objects.create_user('member', password='pw')
+        cls.member_user.groups.add(member_group)
+        cls.member = Member.objects.create(user=cls.member_user, name='Member', email='member@example.com')
+        cls.rows = 0
+
+    def grow_to(self, size):
+        """Add books, members and borrows (open and returned) until there are ``size`` of each"""
+        for i in range(self.rows, size):
+            book = Book.objects.create(title=f'Book {i}', author=f'Author {i}', isbn=f'{i:013d}', available_copies=3)
+            other = Member.objects.create(name=f'Person {i}', email=f'person{i}@example.com')
+            Borrow.objects.create(book=book, member=self.member, borrowed_by=self.librarian, returned=i % 2 == 0)
+            Borrow.objects.create(book=book, member=other, borrowed_by=self.librarian)
+        self.rows = max(self.rows, size)
+
+    def count_queries(self, user, method, url, data=None):
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        # Start cold so cached roles/stats don't make the counts order-dependent
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+        return len(queries.captured_queries)
+
+    def assertFlatBudgets(self, checks):
+        """Run each ``(label, budget key, request)`` check at both dataset sizes.
+
+        ``request()`` performs one request and returns its query count.
+        """
+        counts = {}
+        for size in (self.SMALL, self.LARGE):
+            self.grow_to(size)
+            for label, key, request in checks:
+                counts.setdefault(label, []).append(request())
+        for label, key, _ in checks:
+            with self.subTest(check=label):
+                small, large = counts[label]
+                self.assertEqual(small, large, f'{label} query count grows with row count: {counts[label]}')
+                self.assertLessEqual(large, QUERY_BUDGETS[key], f'{label} exceeds its query budget')
+
+    def users(self, role):
+        return {'anonymous': None, 'librarian': self.librarian, 'member': self.member_user}[role]
+
+    def get(self, role, url):
+        return lambda: self.count_queries(self.users(role), 'get', url)
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        budgeted = {name for _, name in QUERY_BUDGETS}
+        self.assertEqual(names - budgeted, set())
+
+    def test_cold_role_lookup_is_one_query(self):
+        for user, roles in (
+            (self.librarian, {'librarian': True, 'member': False}),
+            (self.member_user, {'librarian': False, 'member': True}),
+        ):
+            for lookup in (get_user_roles, async_to_sync(aget_user_roles)):
+                fresh = User.objects.get(pk=user.pk)
+                cache.clear()
+                with self.assertNumQueries(1):
+                    self.assertEqual(lookup(fresh), roles)
+
+    def test_read_views(self):
+        urls = {
+            'login': reverse('library:login'),
+            'register': reverse('library:register'),
+            'home': reverse('library:home'),
+            'book_list': reverse('library:book_list'),
+            'add_book': reverse('library:add_book'),
+            'members': reverse('library:members'),
+            'member_autocomplete': reverse('library:member_autocomplete') + '?q=person',
+            'logs': reverse('library:logs'),
+            'export_logs': reverse('library:export_logs') + '?format=csv',
+            'my_borrows': reverse('library:my_borrows'),
+            'reports': reverse('library:reports') + '?since=2000-01-01',
+            'metrics': reverse('library:metrics'),
+            'api_books': reverse('library:api_books') + '?q=book&sort=-title',
+            'api_book_detail': reverse('library:api_book_detail', args=[1]),
+            'api_book_by_isbn': reverse('library:api_book_by_isbn', args=['0000000000001']),
+            'api_availability': reverse('library:api_availability') + '?ids=1,2,3',
+        }
+        self.assertFlatBudgets([
+            (f'{role} {name}', (role, name), self.get(role, urls[name]))
+            for role, name in QUERY_BUDGETS if name in urls
+        ])
+
+    def test_search_and_filters(self):
+        def book_page_two(sort):
+            def request():
+                cursor = book_paginator(search_books(''), sort).page().next_cursor
+                return self.count_queries(self.member_user, 'get', reverse('library:book_list') + f'?sort={sort}&after={cursor}')
+            return request
+
+        self.assertFlatBudgets([
+            ('book search', ('librarian', 'book_list'), self.get('librarian', reverse('library:book_list') + '?q=book&sort=-author')),
+            ('book page 2', ('member', 'book_list'), book_page_two('title')),
+            ('book page 2 by stock', ('member', 'book_list'), book_page_two('-available')),
+            ('unreturned logs', ('librarian', 'logs'), self.get('librarian', reverse('library:logs') + '?filter=unreturned')),
+            ('returned logs', ('librarian', 'logs'), self.get('librarian', reverse('library:logs') + '?filter=returned')),
+            ('export jsonl', ('librarian', 'export_logs'), self.get('librarian', reverse('library:export_logs') + '?format=jsonl')),
+            ('archived logs', ('librarian', 'logs'), self.get('librarian', reverse('library:logs') + '?archived=1')),
+            ('archived export', ('librarian', 'export_logs'), self.get('librarian', reverse('library:export_logs') + '?archived=1')),
+            ('archived history', ('member', 'my_borrows'), self.get('member', reverse('library:my_borrows') + '?archived=1')),
+        ])
+
+    def test_book_pages(self):
+        def page(name):
+            return lambda: self.count_queries(
+                self.librarian, 'get', reverse(f'library:{name}', args=[Book.objects.latest('id').id]))
+        self.assertFlatBudgets([(name, ('librarian', name), page(name)) for name in ('edit_book', 'delete_book')])
+
+    def test_borrow_and_return(self):
+        def borrow():
+            book = Book.objects.latest('id')
+            return self.count_queries(self.librarian, 'get', reverse('library:borrow_book', args=[book.id, self.member.id]))
+
+        def return_as(role):
+            def request():
+                borrow = Borrow.objects.filter(member=self.member, returned=False).latest('id')
+                return self.count_queries(self.users(role), 'post', reverse('library:return_book', args=[borrow.id]))
+            return request
+
+        self.assertFlatBudgets([
+            ('borrow', ('librarian', 'borrow_book'), borrow),
+            ('librarian return', ('librarian', 'return_book'), return_as('librarian')),
+            ('member return', ('member', 'return_book'), return_as('member')),
+        ])
+
+    def test_logout(self):
+        self.assertFlatBudgets([('logout', ('member', 'logout'), self.get('member', reverse('library:logout')))])
+
+    def test_admin_changelists(self):
+        counts = {}
+        for size in (self.SMALL, self.LARGE):
+            self.grow_to(size)
+            for model in ('book', 'member', 'borrow'):
+                url = reverse(f'admin:library_{model}_changelist')
+                counts.setdefault(model, []).append(self.count_queries(self.librarian, 'get', url))
+        for model, (small, large) in counts.items():
+            with self.subTest(model=model):
+                self.assertEqual(small, large, f'{model} changelist query count grows: {counts[model]}')
+                self.assertLessEqual(large, ADMIN_CHANGELIST_BUDGET)
+
+
+class RoleTests(TestCase):
+    def test_librarian_with_member_profile_is_also_member(self):
+        librarian_group, _ = create_default_groups()
+        user = User.objects.create_user('desk', password='pw')
+        user.groups.add(librarian_group)
+        Member.objects.create(user=user, name='Desk', email='desk@example.com')
+        both = {'librarian': True, 'member': True}
+        cache.clear()
+        self.assertEqual(get_user_roles(User.objects.get(pk=user.pk)), both)
+        cache.clear()
+        self.assertEqual(async_to_sync(aget_user_roles)(User.objects.get(pk=user.pk)), both)
+        self.assertEqual(get_user_roles(get_cached_user(user.pk)), both)
+
+
+class BorrowAdminSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True, is_superuser=True)
+        clerk = User.objects.create_user('frontdesk-clerk', password='pw')
+        cls.smith = Borrow.objects.create(
+            book=Book.objects.create(title='The Silmarillion', author='J. R. R. Tolkien', isbn='1'),
+            member=Member.objects.create(name='John Smith', email='jsmith@example.com'),
+            borrowed_by=clerk,
+        )
+        cls.other = Borrow.objects.create(
+            book=Book.objects.create(title='Dune', author='Frank Herbert', isbn='2'),
+            member=Member.objects.create(name='Ada Lovelace', email='ada@example.org'),
+            borrowed_by=cls.admin,
+        )
+
+    def search(self, term):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:library_borrow_changelist'), {'q': term})
+        self.assertLessEqual(len(queries), ADMIN_CHANGELIST_BUDGET)
+        return {borrow.id for borrow in response.context['cl'].result_list}
+
+    def test_terms_match_substrings_of_every_related_field(self):
+        for term in ('smith', 'marill', 'tolk', 'example.com', 'desk', 'John Smith', '"john smith"'):
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term), {self.smith.id})
+        self.assertEqual(self.search('example'), {self.smith.id, self.other.id})
+        # Every term has to match somewhere
+        self.assertEqual(self.search('smith dune'), set())
+
+
+class MemberPickerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        Member.objects.bulk_create(Member(name=f'Ann {i:02d}', email=f'ann{i:02d}@example.com') for i in range(12))
+        Member.objects.create(name='Ann Gone', email='gone@example.com', is_active=False)
+        Member.objects.create(name='Zed', email='ANNEX@example.com')
+        Book.objects.bulk_create(
+            Book(title=f'Title {i}', author='Author', isbn=str(i), available_copies=1) for i in range(3)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.librarian)
+
+    def names(self, term):
+        response = self.client.get(reverse('library:member_autocomplete'), {'q': term})
+        return [member['name'] for member in response.json()['results']]
+
+    def test_autocomplete_is_a_limited_prefix_search_over_active_members(self):
+        self.assertEqual(self.names('AN'), [f'Ann {i:02d}' for i in range(10)])
+        self.assertEqual(self.names('annex'), ['Zed'])
+        self.assertEqual(self.names('ann gone'), [])
+        self.assertEqual(self.names('nn'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_book_list_renders_one_picker_and_no_member_options(self):
+        response = self.client.get(reverse('library:book_list'))
+        self.assertContains(response, 'id="memberSearch"', count=1)
+        self.assertContains(response, 'data-book-id=', count=3)
+        self.assertNotContains(response, 'Ann 00')
+        self.assertNotContains(response, '<option value="%d"' % Member.objects.first().id)
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.member = Member.objects.create(name='Member', email='member@example.com')
+        cls.books = [
+            Book.objects.create(title=f'Book {i:02d}', author='Author', isbn=f'{i:013d}', available_copies=2)
+            for i in range(60)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pagination_walks_every_book(self):
+        url, seen = reverse('library:api_books'), []
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(book['id'] for book in data['results'])
+            url = data['next']
+        self.assertEqual(seen, [book.id for book in self.books])
+
+    def test_detail_by_id_and_isbn(self):
+        book = self.books[5]
+        by_id = self.client.get(reverse('library:api_book_detail', args=[book.id])).json()
+        by_isbn = self.client.get(reverse('library:api_book_by_isbn', args=[book.isbn])).json()
+        self.assertEqual(by_id, by_isbn)
+        self.assertEqual(by_id['title'], 'Book 05')
+        self.assertEqual(self.client.get(reverse('library:api_book_by_isbn', args=['missing'])).status_code, 404)
+
+    def test_unchanged_poll_is_304_without_queries(self):
+        url = reverse('library:api_availability') + f'?ids={self.books[0].id}'
+        etag = self.client.get(url)['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_circulation_changes_the_etag(self):
+        url = reverse('library:api_availability') + f'?ids={self.books[0].id}'
+        etag = self.client.get(url)['ETag']
+        lend_book(self.books[0], self.member, self.librarian)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['availability'], {str(self.books[0].id): 1})
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.book = Book.objects.create(title='Cached Title', author='Author', isbn='1', available_copies=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.librarian)
+
+    def test_book_table_is_served_from_cache_until_a_book_changes(self):
+        url = reverse('library:book_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertContains(self.client.get(url), 'Cached Title')
+        self.assertFalse(any('"library_book"."title"' in q['sql'] for q in warm.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+        self.assertContains(self.client.get(url), 'Renamed')
+
+    def test_cached_page_runs_no_catalog_query(self):
+        Book.objects.bulk_create(
+            Book(title=f'Shelf {i:02d}', author='Author', isbn=f'2{i:012d}', available_copies=i % 3) for i in range(30)
+        )
+        first = self.client.get(reverse('library:book_list') + '?sort=-available')
+        url = reverse('library:book_list') + f'?sort=-available&after={first.context["page"].next_cursor}'
+        page_two = [book.id for book in self.client.get(url).context['page']]
+        self.assertEqual(
+            page_two,
+            list(Book.objects.order_by('-available_copies', 'title', 'id').values_list('id', flat=True)[25:]),
+        )
+        # Only the session and the user; the table, its page and its count all come from the cache
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(url), 'Shelf')
+
+    def test_librarian_and_member_tables_are_cached_separately(self):
+        url = reverse('library:book_list')
+        self.assertContains(self.client.get(url), 'borrow-button')
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+        self.assertNotContains(self.client.get(url), 'borrow-button')
+
+
+class AsyncViewTests(TestCase):
+    """The read paths served through the ASGI handler, as under uvicorn"""
+
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, member_group = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.member_user = User.objects.create_user('member', password='pw')
+        cls.member_user.groups.add(member_group)
+        cls.member = Member.objects.create(user=cls.member_user, name='Member', email='member@example.com')
+        cls.book = Book.objects.create(title='Async Title', author='Author', isbn='1', available_copies=2)
+        lend_book(cls.book, cls.member, cls.librarian)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_librarian_pages(self):
+        await self.async_client.aforce_login(self.librarian)
+        response = await self.async_client.get(reverse('library:book_list'))
+        self.assertContains(response, 'Async Title')
+        response = await self.async_client.get(reverse('library:logs'))
+        self.assertContains(response, 'Member')
+
+    async def test_member_history_and_role_check(self):
+        await self.async_client.aforce_login(self.member_user)
+        response = await self.async_client.get(reverse('library:my_borrows'))
+        self.assertContains(response, 'Async Title')
+        response = await self.async_client.get(reverse('library:logs'))
+        self.assertNotEqual(response.status_code, 200)
+
+    async def test_export_streams_without_buffering(self):
+        for _ in range(4):
+            await Borrow.objects.acreate(book=self.book, member=self.member, returned=True)
+        await self.async_client.aforce_login(self.librarian)
+        with mock.patch('library.exports.EXPORT_CHUNK_SIZE', 2), warnings.catch_warnings():
+            # Django warns when it has to read a sync iterator whole under ASGI
+            warnings.simplefilter('error')
+            response = await self.async_client.get(reverse('library:export_logs') + '?format=jsonl')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b''.join(chunks).splitlines()), 5)
+
+    async def test_export_link_works_for_any_logs_filter(self):
+        await self.async_client.aforce_login(self.librarian)
+        for filter_type in ('unreturned', 'bogus'):
+            response = await self.async_client.get(reverse('library:logs') + f'?filter={filter_type}&archived=1')
+            link = re.search(r'href="(%s[^"]*)"' % re.escape(reverse('library:export_logs')), response.content.decode())
+            export = await self.async_client.get(html.unescape(link.group(1)))
+            self.assertEqual(export.status_code, 200, link.group(1))
+
+    async def test_api_poll(self):
+        url = reverse('library:api_availability') + f'?ids={self.book.id}'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json(), {'availability': {str(self.book.id): 1}})
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class LogsPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        book = Book.objects.create(title='Title', author='Author', isbn='1', available_copies=10)
+        member = Member.objects.create(name='Member', email='member@example.com')
+        now = timezone.now()
+        # Pairs of loans share a borrow_date, so the id has to break the ties
+        for i in range(8):
+            borrow = Borrow.objects.create(book=book, member=member, borrowed_by=cls.librarian)
+            Borrow.objects.filter(pk=borrow.pk).update(borrow_date=now - timedelta(days=i // 2))
+        cls.newest_first = list(Borrow.objects.order_by('-borrow_date', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.librarian)
+        patcher = mock.patch('library.views.LOGS_PER_PAGE', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def page(self, **params):
+        # Cold caches each time, so every page pays for the same lookups
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(reverse('library:logs'), params).context['page']
+        return page, len(queries.captured_queries)
+
+    def test_cursors_walk_every_loan_once_in_a_fixed_number_of_queries(self):
+        page, first_count = self.page()
+        pages = [[borrow.id for borrow in page]]
+        seen = list(pages[0])
+        while page.has_next:
+            page, count = self.page(after=page.next_cursor)
+            self.assertEqual(count, first_count)
+            pages.append([borrow.id for borrow in page])
+            seen += pages[-1]
+        self.assertEqual(seen, self.newest_first)
+
+        while page.has_previous:
+            page, _ = self.page(before=page.previous_cursor)
+            pages.pop()
+            self.assertEqual([borrow.id for borrow in page], pages[-1])
+
+    def test_a_bad_cursor_falls_back_to_the_first_page(self):
+        page, _ = self.page(after='not-a-cursor')
+        self.assertEqual([borrow.id for borrow in page], self.newest_first[:3])
+
+
+class SummaryCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.book = Book.objects.create(title='Title', author='Author', isbn='1', available_copies=10)
+        cls.members = [Member.objects.create(name=f'Member {i}', email=f'm{i}@example.com') for i in range(3)]
+        Member.objects.create(name='Old', email='old@example.com', is_active=False, joined_date='2000-01-01')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.librarian)
+
+    def stats(self, name):
+        return self.client.get(reverse(f'library:{name}')).context['stats']
+
+    def test_logs_cards_follow_borrows_and_returns(self):
+        borrows = [lend_book(self.book, member, self.librarian) for member in self.members]
+        Borrow.objects.filter(pk=borrows[0].pk).update(borrow_date=timezone.now() - timedelta(days=2))
+        receive_book(borrows[0], self.librarian)
+        self.assertEqual(self.stats('logs'), {'total': 3, 'unreturned': 2, 'returned': 1, 'today': 2})
+
+        # Served from the cache until a borrow or return invalidates it
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(aborrow_stats)()['total'], 3)
+        lend_book(self.book, self.members[0], self.librarian)
+        self.assertEqual(self.stats('logs'), {'total': 4, 'unreturned': 3, 'returned': 1, 'today': 3})
+        receive_book(borrows[1], self.librarian)
+        self.assertEqual(self.stats('logs'), {'total': 4, 'unreturned': 2, 'returned': 2, 'today': 3})
+
+    def test_members_card_follows_member_changes(self):
+        self.assertEqual(self.stats('members'), {'total': 4, 'active': 3, 'new_this_month': 3})
+        Member.objects.create(name='New', email='new@example.com')
+        self.assertEqual(self.stats('members'), {'total': 5, 'active': 4, 'new_this_month': 4})
+        self.members[0].is_active = False
+        self.members[0].save()
+        self.assertEqual(self.stats('members'), {'total': 5, 'active': 3, 'new_this_month': 4})
+
+
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.member = Member.objects.create(name='Member', email='member@example.com')
+        cls.book = Book.objects.create(title='Title', author='Author', isbn='1', available_copies=2)
+
+    def setUp(self):
+        # Declare a replica without opening it: the router only checks the alias exists
+        patcher = mock.patch.dict(connections.databases, {REPLICA: connections.databases[DEFAULT_DB_ALIAS]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_leave_the_replica_after_a_write(self):
+        router = ReplicaRouter()
+        with routing() as state:
+            self.assertEqual(router.db_for_read(Book), DEFAULT_DB_ALIAS)
+            state.use_replica = True
+            self.assertEqual(router.db_for_read(Book), REPLICA)
+            self.assertEqual(router.db_for_read(User), DEFAULT_DB_ALIAS)
+            Book.objects.filter(id=self.book.id).update(available_copies=1)
+            self.assertEqual(router.db_for_read(Book), DEFAULT_DB_ALIAS)
+            self.assertEqual(router.db_for_write(Book), DEFAULT_DB_ALIAS)
+
+    def test_a_write_pins_the_browser_to_the_primary(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('library:borrow_book', args=[self.book.id, self.member.id]))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # Pinned, the read-only views stay on the primary (the test database
+        # refuses queries to the replica alias)
+        self.assertEqual(self.client.get(reverse('library:book_list')).status_code, 200)
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('library:book_list')).cookies)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['library.backends.CachedModelBackend'],
+)
+class CachedSessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='librarian', password='pw')
+
+    def test_warm_request_needs_no_sql_before_the_view(self):
+        self.client.get(reverse('library:home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('library:home'))
+        self.assertRedirects(response, reverse('library:book_list'), fetch_redirect_response=False)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_logout_ends_the_cached_session(self):
+        self.client.get(reverse('library:home'))
+        other = Client()
+        other.cookies[settings.SESSION_COOKIE_NAME] = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get(reverse('library:logout'))
+        response = other.get(reverse('library:home'))
+        self.assertRedirects(response, reverse('library:login'), fetch_redirect_response=False)
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.get(reverse('library:home'))
+        self.librarian.set_password('changed')
+        self.librarian.save()
+        response = self.client.get(reverse('library:home'))
+        self.assertRedirects(response, reverse('library:login'), fetch_redirect_response=False)
+
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+    def test_uncached_backend_sees_changes_no_bump_reached(self):
+        # The default with a per-worker cache: a change made through another
+        # worker leaves this one's cache untouched, as this queryset update does
+        self.client.login(username='librarian', password='pw')
+        response = self.client.get(reverse('library:home'))
+        self.assertRedirects(response, reverse('library:book_list'), fetch_redirect_response=False)
+        User.objects.filter(pk=self.librarian.pk).update(is_active=False)
+        response = self.client.get(reverse('library:home'))
+        self.assertRedirects(response, reverse('library:login'), fetch_redirect_response=False)
+
+class CirculationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.book = Book.objects.create(title='Last Copy', author='Author', isbn='1', available_copies=1)
+        cls.members = [Member.objects.create(name=f'Member {i}', email=f'm{i}@example.com') for i in range(2)]
+
+    def test_a_stale_book_cannot_oversell_the_last_copy(self):
+        # Both counters hold the same instance, loaded while one copy was left
+        lend_book(self.book, self.members[0], self.librarian)
+        self.assertEqual(self.book.available_copies, 1)
+        with self.assertRaises(BookUnavailable):
+            lend_book(self.book, self.members[1], self.librarian)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Borrow.objects.count(), 1)
+
+    def test_a_failed_insert_rolls_the_stock_back(self):
+        with mock.patch.object(Borrow.objects, 'create', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            lend_book(self.book, self.members[0], self.librarian)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.open_loans), (1, 0))
+
+    def test_a_double_return_restocks_once(self):
+        borrow = lend_book(self.book, self.members[0], self.librarian)
+        stale = Borrow.objects.get(pk=borrow.pk)
+        receive_book(borrow, self.librarian)
+        with self.assertRaises(AlreadyReturned):
+            receive_book(stale, self.librarian)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('library:return_book', args=[borrow.id]), follow=True)
+        self.assertContains(response, 'already been returned')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+
+class LoanCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True, is_superuser=True)
+        cls.book = Book.objects.create(title='Title', author='Author', isbn='1', available_copies=5)
+        cls.member = Member.objects.create(name='Member', email='member@example.com')
+
+    def counters(self):
+        self.book.refresh_from_db()
+        self.member.refresh_from_db()
+        return [(row.open_loans, row.total_loans) for row in (self.book, self.member)]
+
+    def test_borrow_and_return_keep_the_counters(self):
+        borrows = [lend_book(self.book, self.member, self.admin) for _ in range(3)]
+        self.assertEqual(self.counters(), [(3, 3), (3, 3)])
+        receive_book(borrows[0], self.admin)
+        self.assertEqual(self.counters(), [(2, 3), (2, 3)])
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        lend_book(self.book, self.member, self.admin)
+        # Entered outside lend_book(), as the admin or a raw import would
+        Borrow.objects.create(book=self.book, member=self.member, returned=True)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--check', stdout=StringIO())
+        self.assertEqual(self.counters(), [(1, 1), (1, 1)])
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('books: 1 drifted rows fixed', out.getvalue())
+        self.assertEqual(self.counters(), [(1, 2), (1, 2)])
+        call_command('reconcile_counters', '--check', stdout=StringIO())
+
+    def test_admin_reads_the_counters_without_scanning_borrows(self):
+        lend_book(self.book, self.member, self.admin)
+        self.client.force_login(self.admin)
+        for model in ('book', 'member'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:library_{model}_changelist'))
+            self.assertContains(response, 'Currently Borrowed')
+            self.assertFalse(any('library_borrow' in q['sql'] for q in queries.captured_queries), model)
+            self.assertLessEqual(len(queries), ADMIN_CHANGELIST_BUDGET)
+
+
+class OverdueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.member = Member.objects.create(name='Member', email='member@example.com')
+        cls.book = Book.objects.create(title='Book', author='Author', isbn='1', available_copies=5)
+        cls.short_loan = Book.objects.create(title='Atlas', author='Author', isbn='2', available_copies=1,
+                                             loan_period_days=2)
+
+    def test_loan_period_comes_from_the_book_or_the_default(self):
+        borrow = lend_book(self.book, self.member, self.librarian)
+        self.assertEqual(borrow.due_date - borrow.borrow_date, timedelta(days=settings.LIBRARY_LOAN_DAYS))
+        borrow = lend_book(self.short_loan, self.member, self.librarian)
+        self.assertEqual(borrow.due_date - borrow.borrow_date, timedelta(days=2))
+
+    def test_scan_flags_open_loans_past_due_in_chunks(self):
+        now = timezone.now()
+        late = [lend_book(self.book, self.member, self.librarian) for _ in range(3)]
+        on_time = lend_book(self.book, self.member, self.librarian)
+        returned = lend_book(self.short_loan, self.member, self.librarian)
+        receive_book(returned, self.librarian)
+        Borrow.objects.filter(id__in=[borrow.id for borrow in late + [returned]]).update(due_date=now - timedelta(days=1))
+
+        self.assertEqual(flag_overdue_loans(now, chunk_size=2), 3)
+        self.assertEqual(flag_overdue_loans(now, chunk_size=2), 0)
+        self.assertEqual(set(Borrow.objects.filter(overdue=True).values_list('id', flat=True)),
+                         {borrow.id for borrow in late})
+        self.assertEqual(list(overdue_loans(now).values_list('id', flat=True)), [borrow.id for borrow in late])
+        self.assertNotIn(on_time.id, set(overdue_loans(now).values_list('id', flat=True)))
+
+        out = StringIO()
+        call_command('scan_overdue', '--list=1', stdout=out)
+        self.assertIn('Overdue loans: 3', out.getvalue())
+
+
+class HoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.book = Book.objects.create(title='Hot Title', author='Author', isbn='1', available_copies=2)
+        cls.members = [Member.objects.create(name=f'Member {i}', email=f'm{i}@example.com') for i in range(6)]
+
+    def test_returns_go_to_the_queue_in_order_before_the_shelf(self):
+        borrows = [lend_book(self.book, member, self.librarian) for member in self.members[:2]]
+        with self.assertRaises(BookUnavailable):
+            lend_book(self.book, self.members[2], self.librarian)
+        holds = [place_hold(self.book, member)[0] for member in self.members[2:]]
+        self.assertEqual(place_hold(self.book, self.members[2]), (holds[0], False))
+        self.assertEqual([queue_position(hold) for hold in holds], [1, 2, 3, 4])
+
+        for borrow in borrows:
+            receive_book(borrow, self.librarian)
+        self.assertEqual([borrow.allocated_hold.id for borrow in borrows], [holds[0].id, holds[1].id])
+        self.assertEqual(
+            list(Hold.objects.order_by('id').values_list('status', flat=True)),
+            [Hold.READY, Hold.READY, Hold.WAITING, Hold.WAITING],
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+        # Only the member the copy is held for can take it
+        with self.assertRaises(BookUnavailable):
+            lend_book(self.book, self.members[0], self.librarian)
+        lend_book(self.book, self.members[2], self.librarian)
+        holds[0].refresh_from_db()
+        self.assertEqual(holds[0].status, Hold.FULFILLED)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.open_loans), (0, 1))
+
+    def test_cancelling_a_ready_hold_passes_the_copy_on(self):
+        borrow = lend_book(self.book, self.members[0], self.librarian)
+        lend_book(self.book, self.members[1], self.librarian)
+        first, _ = place_hold(self.book, self.members[2])
+        second, _ = place_hold(self.book, self.members[3])
+        receive_book(borrow, self.librarian)
+
+        self.assertTrue(cancel_hold(first))
+        self.assertFalse(cancel_hold(first))
+        second.refresh_from_db()
+        self.assertEqual(second.status, Hold.READY)
+        self.assertTrue(cancel_hold(second))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_borrow_view_queues_the_member_when_no_copy_is_left(self):
+        self.book.available_copies = 0
+        self.book.save()
+        client = Client()
+        client.force_login(self.librarian)
+        response = client.post(reverse('library:borrow_book', args=[self.book.id, self.members[0].id]), follow=True)
+        self.assertContains(response, 'hold queue at position 1')
+        self.assertTrue(Hold.objects.filter(member=self.members[0], status=Hold.WAITING).exists())
+
+
+    def test_book_list_offers_holds_and_pickup_when_the_shelf_is_empty(self):
+        client = Client()
+        client.force_login(self.librarian)
+        borrow = lend_book(self.book, self.members[0], self.librarian)
+        lend_book(self.book, self.members[1], self.librarian)
+        response = client.get(reverse('library:book_list'))
+        self.assertContains(response, 'Place hold')
+        self.assertNotContains(response, 'Check out')
+
+        client.get(reverse('library:borrow_book', args=[self.book.id, self.members[2].id]))
+        hold = Hold.objects.get(member=self.members[2])
+        receive_book(borrow, self.librarian)
+        response = client.get(reverse('library:book_list'))
+        self.assertContains(response, 'Check out')
+        response = client.get(reverse('library:borrow_book', args=[self.book.id, self.members[2].id]), follow=True)
+        self.assertContains(response, 'borrowed successfully by Member 2')
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, Hold.FULFILLED)
+
+    def test_taking_a_shelf_copy_ends_the_borrowers_own_hold(self):
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        hold, _ = place_hold(self.book, self.members[0])
+        Book.objects.filter(pk=self.book.pk).update(available_copies=1)
+        client = Client()
+        client.force_login(self.librarian)
+        client.get(reverse('library:borrow_book', args=[self.book.id, self.members[0].id]))
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, Hold.FULFILLED)
+        # The returned copy goes back to the shelf, not to a second loan for the same member
+        borrow = Borrow.objects.get(member=self.members[0])
+        self.assertIsNone(receive_book(borrow, self.librarian).allocated_hold)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, _ = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.books = [Book.objects.create(title=f'Book {i}', author='Author', isbn=str(i), available_copies=5) for i in range(2)]
+        cls.members = [Member.objects.create(name=f'Member {i}', email=f'm{i}@example.com') for i in range(2)]
+
+    def refresh(self, **kwargs):
+        return refresh_rollups(settle=timedelta(0), **kwargs)
+
+    def assertRollupsMatchBorrows(self):
+        expected_days, expected_months = {}, {}
+        for borrow in Borrow.objects.all():
+            events = [('borrows', borrow.borrow_date)] + ([('returns', borrow.return_date)] if borrow.return_date else [])
+            for column, moment in events:
+                day = timezone.localtime(moment).date()
+                for rollup, key in ((expected_days, (borrow.book_id, day)),
+                                    (expected_months, (borrow.member_id, day.replace(day=1)))):
+                    counts = rollup.setdefault(key, {'borrows': 0, 'returns': 0})
+                    counts[column] += 1
+        self.assertEqual(
+            {(row.book_id, row.day): {'borrows': row.borrows, 'returns': row.returns} for row in BookDailyLoans.objects.all()},
+            expected_days,
+        )
+        self.assertEqual(
+            {(row.member_id, row.month): {'borrows': row.borrows, 'returns': row.returns}
+             for row in MemberMonthlyLoans.objects.all()},
+            expected_months,
+        )
+
+    def test_refresh_counts_only_new_events(self):
+        now = timezone.now()
+        old = [
+            Borrow.objects.create(book=self.books[i % 2], member=self.members[i % 2],
+                                  borrow_date=now - timedelta(days=40 + i), due_date=now)
+            for i in range(5)
+        ]
+        Borrow.objects.filter(pk=old[0].pk).update(returned=True, return_date=now - timedelta(days=35))
+        self.assertEqual(self.refresh(batch_size=2), (5, 1))
+        self.assertRollupsMatchBorrows()
+        self.assertEqual(self.refresh(), (0, 0))
+
+        # A return of a loan counted earlier and a new loan returned straight away
+        receive_book(old[1], self.librarian)
+        receive_book(lend_book(self.books[0], self.members[1], self.librarian), self.librarian)
+        self.assertEqual(self.refresh(), (1, 2))
+        self.assertRollupsMatchBorrows()
+
+    def test_returns_inside_the_settle_window_wait_for_the_next_run(self):
+        borrow = lend_book(self.books[0], self.members[0], self.librarian)
+        refresh_rollups()
+        receive_book(borrow, self.librarian)
+        self.assertEqual(refresh_rollups(), (0, 0))
+        self.assertEqual(self.refresh(), (0, 1))
+        self.assertRollupsMatchBorrows()
+
+    def test_reports_read_the_rollups(self):
+        for member in self.members:
+            lend_book(self.books[1], member, self.librarian)
+        lend_book(self.books[0], self.members[0], self.librarian)
+        self.refresh()
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('library:reports'))
+        self.assertEqual(response.context['totals'], {'borrows': 3, 'returns': 0})
+        self.assertEqual([row['book_id'] for row in response.context['most_borrowed']], [self.books[1].id, self.books[0].id])
+        self.assertEqual([row['members'] for row in response.context['per_month']], [2])
+        self.assertEqual(self.client.get(reverse('library:reports') + '?since=junk').status_code, 400)
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian_group, member_group = create_default_groups()
+        cls.librarian = User.objects.create_user('librarian', password='pw')
+        cls.librarian.groups.add(librarian_group)
+        cls.member_user = User.objects.create_user('member', password='pw')
+        cls.member_user.groups.add(member_group)
+        cls.member = Member.objects.create(user=cls.member_user, name='Member', email='member@example.com')
+        cls.book = Book.objects.create(title='Book', author='Author', isbn='1', available_copies=10)
+
+    def setUp(self):
+        now = timezone.now()
+        self.borrows = [lend_book(self.book, self.member, self.librarian) for _ in range(6)]
+        for i, borrow in enumerate(self.borrows):
+            Borrow.objects.filter(pk=borrow.pk).update(borrow_date=now - timedelta(days=400 - i))
+        for borrow in self.borrows[:4]:
+            receive_book(borrow, self.librarian)
+        Borrow.objects.filter(pk__in=[borrow.pk for borrow in self.borrows[:3]]).update(
+            return_date=now - timedelta(days=380))
+        self.cutoff = now - timedelta(days=365)
+
+    def test_only_loans_counted_by_the_rollups_are_archived(self):
+        self.assertEqual(archive_borrows(self.cutoff), 0)
+        refresh_rollups(settle=timedelta(0))
+        self.assertEqual(archive_borrows(self.cutoff, batch_size=2), 3)
+        self.assertEqual(archive_borrows(self.cutoff), 0)
+        self.assertEqual(set(ArchivedBorrow.objects.values_list('id', flat=True)), {b.id for b in self.borrows[:3]})
+        self.assertEqual(Borrow.objects.count(), 3)
+
+        # Counters, totals and a full rollup rebuild still see the archived loans
+        self.assertEqual(reconcile_loan_counters(Member), 0)
+        self.assertEqual(rebuild_rollups(settle=timedelta(0)), (6, 4))
+
+    def test_history_views_read_the_archive_when_asked(self):
+        refresh_rollups(settle=timedelta(0))
+        archive_borrows(self.cutoff)
+        newest_first = [borrow.id for borrow in reversed(self.borrows)]
+
+        self.client.force_login(self.member_user)
+        response = self.client.get(reverse('library:my_borrows'))
+        self.assertEqual(len(response.context['borrows']), 3)
+        response = self.client.get(reverse('library:my_borrows') + '?archived=1')
+        self.assertEqual([borrow.id for borrow in response.context['borrows']], newest_first)
+
+        self.client.force_login(self.librarian)
+        with mock.patch('library.views.LOGS_PER_PAGE', 4):
+            first = self.client.get(reverse('library:logs') + '?archived=1')
+            second = self.client.get(reverse('library:logs') + f'?archived=1&after={first.context["page"].next_cursor}')
+            back = self.client.get(reverse('library:logs') + f'?archived=1&before={second.context["page"].previous_cursor}')
+        self.assertEqual([borrow.id for borrow in first.context['page']], newest_first[:4])
+        self.assertEqual([borrow.id for borrow in second.context['page']], newest_first[4:])
+        self.assertEqual([borrow.id for borrow in back.context['page']], newest_first[:4])
+        self.assertEqual(first.context['stats']['total'], 6)
+
+        export = self.client.get(reverse('library:export_logs') + '?format=jsonl&archived=1')
+        ids = [json.loads(line)['id'] for line in b''.join(export.streaming_content).decode().splitlines()]
+        self.assertEqual(ids, sorted(borrow.id for borrow in self.borrows))
+
+    def test_generate_data_flush_clears_dependent_tables(self):
+        refresh_rollups(settle=timedelta(0))
+        archive_borrows(self.cutoff)
+        place_hold(self.book, self.member)
+        call_command('generate_data', books=5, members=3, loans=10, flush=True, stdout=StringIO())
+        # Foreign keys are only checked at commit, which a TestCase never reaches
+        connection.check_constraints()
+        for model in (ArchivedBorrow, Hold, BookDailyLoans, MemberMonthlyLoans):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+        self.assertEqual(Borrow.objects.count(), 10)
+
+
+class ImportBooksTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_jsonl(self, records):
+        path = os.path.join(self.directory, 'books.jsonl')
+        with open(path, 'w', encoding='utf-8') as stream:
+            for record in records:
+                stream.write(json.dumps(record) + '\n')
+        return path
+
+    def test_rejects_records_with_non_text_fields(self):
+        source = self.write_jsonl([
+            {'title': 1984, 'author': 'George Orwell', 'isbn': '9780451524935'},
+            {'title': ['Dune'], 'author': 'Frank Herbert', 'isbn': '9780441172719'},
+        ])
+        rejects = os.path.join(self.directory, 'rejects.csv')
+        call_command('import_books', source, rejects=rejects, stdout=StringIO())
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['1984'])
+        with open(rejects, encoding='utf-8') as stream:
+            rows = list(csv.reader(stream))
+        self.assertEqual([row[:2] for row in rows[1:]], [['2', "title is not text: ['Dune']"]])
+
+        with self.assertRaises(CommandError):
+            call_command('import_books', source, rejects=os.path.join(self.directory, 'missing', 'rejects.csv'),
+                         stdout=StringIO())
+
+    def test_failed_batch_still_moves_the_catalog_version_on(self):
+        source = self.write_jsonl([
+            {'title': '1984', 'author': 'George Orwell', 'isbn': '9780451524935'},
+            {'title': 'Dune', 'author': 'Frank Herbert', 'isbn': '9780441172719'},
+        ])
+        bulk_create = Book.objects.bulk_create
+        batches = iter([bulk_create, mock.Mock(side_effect=DatabaseError('disk I/O error'))])
+        version = get_version(CATALOG)
+        with mock.patch.object(Book.objects, 'bulk_create', lambda *args, **kwargs: next(batches)(*args, **kwargs)):
+            with self.assertRaises(DatabaseError):
+                call_command('import_books', source, batch_size=1, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertNotEqual(get_version(CATALOG), version)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'library'
 
@@ -18,6 +18,7 @@ urlpatterns = [
     
     # Members
     path('members/', views.members, name='members'),
+    path('members/autocomplete/', views.member_autocomplete, name='member_autocomplete'),
     
     # Borrow/Return
     path('borrow/<int:book_id>/<int:member_id>/', views.borrow_book, name='borrow_book'),
@@ -25,5 +26,16 @@ urlpatterns = [
     
     # Logs
     path('logs/', views.logs, name='logs'),
+    path('logs/export/', views.export_logs, name='export_logs'),
     path('my-borrows/', views.my_borrows, name='my_borrows'),
+    path('reports/', views.reports, name='reports'),
+    
+    # JSON catalog API
+    path('api/v1/books/', api.books, name='api_books'),
+    path('api/v1/books/<int:book_id>/', api.book_detail, name='api_book_detail'),
+    path('api/v1/books/isbn/<str:isbn>/', api.book_by_isbn, name='api_book_by_isbn'),
+    path('api/v1/availability/', api.availability, name='api_availability'),
+    
+    # Monitoring
+    path('metrics/', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
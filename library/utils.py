@@ -1,32 +1,176 @@
-from django.contrib.auth.models import Group
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django.shortcuts import redirect
 from django.contrib import messages
+from .metrics import timed
+from .models import Member
+
+
+LIBRARIAN_GROUP = 'Librarian'
+MEMBER_GROUP = 'Member'
+
+# Cross-request role and user cache. Entries are keyed by the user's role
+# version, which is bumped whenever the user, their group membership or their
+# member profile changes, so a stale entry is simply never read again. The
+# timeout bounds staleness on per-process cache backends that cannot see
+# another worker's bump.
+ROLE_CACHE_TIMEOUT = 300
+_REQUEST_ROLES_ATTR = '_library_roles'
+
+
+def _role_version_key(user_id):
+    return f'library:roles:version:{user_id}'
+
+
+def _role_key(user_id, version):
+    return f'library:roles:{user_id}:{version}'
+
+
+def bump_role_version(user_ids):
+    """Invalidate cached roles for the given user ids"""
+    for user_id in user_ids:
+        key = _role_version_key(user_id)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr(); any fresh value invalidates
+            cache.set(key, 1, None)
+
+
+def _user_key(user_id, version):
+    return f'library:user:{user_id}:{version}'
+
+
+def _roles_from(group_names, has_member_profile):
+    librarian = LIBRARIAN_GROUP in group_names
+    member = MEMBER_GROUP in group_names or has_member_profile
+    return {'librarian': librarian, 'member': member}
+
+
+def get_cached_user(user_id):
+    """Load a user with its groups and member profile as one entry in the shared cache.
+
+    The entry is keyed by the role version, which user saves (password
+    changes included), group changes and member profile changes all bump.
+    The user comes back with its roles already resolved. The member profile
+    is there for identity; its loan counters change without a bump, so
+    read them from the database.
+    """
+    with timed('auth'):
+        key = _user_key(user_id, cache.get(_role_version_key(user_id), 0))
+        user = cache.get(key)
+        if user is None:
+            user = User.objects.select_related('member_profile').prefetch_related('groups').filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, ROLE_CACHE_TIMEOUT)
+    roles = _roles_from({group.name for group in user.groups.all()}, hasattr(user, 'member_profile'))
+    setattr(user, _REQUEST_ROLES_ATTR, roles)
+    return user
+
+
+def _roles_query(user_id):
+    """Role flags for one user as a single row: both groups and the member profile in one query"""
+    groups = User.groups.through.objects.filter(user_id=OuterRef('pk'))
+    return User.objects.filter(pk=user_id).annotate(
+        in_librarian_group=Exists(groups.filter(group__name=LIBRARIAN_GROUP)),
+        in_member_group=Exists(groups.filter(group__name=MEMBER_GROUP)),
+        has_member_profile=Exists(Member.objects.filter(user_id=OuterRef('pk'))),
+    ).values_list('in_librarian_group', 'in_member_group', 'has_member_profile')
+
+
+def _roles_from_row(row):
+    librarian, member_group, has_member_profile = row or (False, False, False)
+    return {'librarian': librarian, 'member': member_group or has_member_profile}
+
+
+def _load_roles(user):
+    return _roles_from_row(_roles_query(user.pk).first())
+
+
+def get_user_roles(user):
+    """Resolve a user's roles once per request, backed by the shared cache"""
+    if not user.is_authenticated:
+        return {'librarian': False, 'member': False}
+    roles = getattr(user, _REQUEST_ROLES_ATTR, None)
+    if roles is None:
+        with timed('auth'):
+            version = cache.get(_role_version_key(user.pk), 0)
+            key = _role_key(user.pk, version)
+            roles = cache.get(key)
+            if roles is None:
+                roles = _load_roles(user)
+                cache.set(key, roles, ROLE_CACHE_TIMEOUT)
+        setattr(user, _REQUEST_ROLES_ATTR, roles)
+    return roles
+
+
+async def _aload_roles(user):
+    return _roles_from_row(await _roles_query(user.pk).afirst())
+
+
+async def aget_user_roles(user):
+    """Async ORM counterpart of get_user_roles(), sharing its cache entries"""
+    if not user.is_authenticated:
+        return {'librarian': False, 'member': False}
+    roles = getattr(user, _REQUEST_ROLES_ATTR, None)
+    if roles is None:
+        with timed('auth'):
+            version = await cache.aget(_role_version_key(user.pk), 0)
+            key = _role_key(user.pk, version)
+            roles = await cache.aget(key)
+            if roles is None:
+                roles = await _aload_roles(user)
+                await cache.aset(key, roles, ROLE_CACHE_TIMEOUT)
+        setattr(user, _REQUEST_ROLES_ATTR, roles)
+    return roles
+
+
+async def arequest_user(request):
+    """Resolve the user for an async view and pin it on ``request.user``.
+
+    Templates and the role filters read ``request.user``; once it holds the
+    resolved user (with its memoised roles) they never touch the database
+    from the event loop.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
 
 
 def is_librarian(user):
     """Check if user is a librarian"""
-    if not user.is_authenticated:
-        return False
-    return user.groups.filter(name='Librarian').exists()
+    return get_user_roles(user)['librarian']
 
 
 def is_member(user):
     """Check if user is a member"""
-    if not user.is_authenticated:
-        return False
-    return user.groups.filter(name='Member').exists() or hasattr(user, 'member_profile')
+    return get_user_roles(user)['member']
+
+
+async def ais_librarian(user):
+    return (await aget_user_roles(user))['librarian']
+
+
+async def ais_member(user):
+    return (await aget_user_roles(user))['member']
 
 
 def librarian_required(view_func):
-    """Decorator to ensure only librarians can access a view"""
+    """Decorator to ensure only librarians can access a view (sync or async)"""
     from django.contrib.auth.decorators import user_passes_test
-    return user_passes_test(is_librarian, login_url='/login/')(view_func)
+    test = ais_librarian if iscoroutinefunction(view_func) else is_librarian
+    return user_passes_test(test, login_url='/login/')(view_func)
 
 
 def member_required(view_func):
-    """Decorator to ensure only members can access a view"""
+    """Decorator to ensure only members can access a view (sync or async)"""
     from django.contrib.auth.decorators import user_passes_test
-    return user_passes_test(is_member, login_url='/login/')(view_func)
+    test = ais_member if iscoroutinefunction(view_func) else is_member
+    return user_passes_test(test, login_url='/login/')(view_func)
 
 
 def get_user_role(user):
@@ -41,6 +185,6 @@ def get_user_role(user):
 
 def create_default_groups():
     """Create default groups if they don't exist"""
-    librarian_group, created = Group.objects.get_or_create(name='Librarian')
-    member_group, created = Group.objects.get_or_create(name='Member')
-    return librarian_group, member_group 
\ No newline at end of file
+    librarian_group, created = Group.objects.get_or_create(name=LIBRARIAN_GROUP)
+    member_group, created = Group.objects.get_or_create(name=MEMBER_GROUP)
+    return librarian_group, member_group
@@ -0,0 +1,59 @@
+"""Change versions for cached catalog and member content.
+
+Cache keys and ETags embed the version of the data they were built from;
+bumping it makes every older entry unreachable instead of deleting them.
+"""
+import time
+
+from django.core.cache import cache
+
+
+CATALOG = 'catalog'
+MEMBERS = 'members'
+
+# Versions expire so that per-process cache backends, which never see
+# another worker's bump, serve stale content for at most this long.
+VERSION_TIMEOUT = 300
+
+
+def _version_key(scope):
+    return f'library:version:{scope}'
+
+
+def _fresh_version():
+    # Milliseconds since the epoch: a re-created key never repeats a value
+    # an earlier (evicted) version already handed out
+    return int(time.time() * 1000)
+
+
+def get_version(scope):
+    """Current change version of ``scope`` (CATALOG or MEMBERS)"""
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), VERSION_TIMEOUT)
+        version = cache.get(key, 0)
+    return version
+
+
+async def aget_version(scope):
+    """Async counterpart of get_version()"""
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _fresh_version(), VERSION_TIMEOUT)
+        version = await cache.aget(key, 0)
+    return version
+
+
+def bump_version(*scopes):
+    """Invalidate everything cached against the given scopes"""
+    for scope in scopes:
+        key = _version_key(scope)
+        if cache.add(key, _fresh_version(), VERSION_TIMEOUT):
+            continue
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr(); any fresh value invalidates
+            cache.set(key, _fresh_version(), VERSION_TIMEOUT)
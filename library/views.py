@@ -1,14 +1,41 @@
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
-from django.http import HttpResponseRedirect, JsonResponse
+from django.utils.dateparse import parse_date
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import Group
-from .models import Book, Member, Borrow
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.db.models import Exists, OuterRef
+from .models import ArchivedBorrow, Book, Hold, Member, Borrow
+from .circulation import AlreadyReturned, BookUnavailable, lend_book, place_hold, queue_position, receive_book
+from .exports import EXPORT_FORMATS, EXPORT_STATUSES, astream, export_borrow_rows
 from .forms import MemberForm, BorrowForm, UserRegistrationForm, UserLoginForm, BookForm
-from .utils import is_librarian, is_member, librarian_required, member_required, create_default_groups
+from .metrics import REGISTRY
+from .pagination import InvalidCursor, KeysetPaginator, MergedKeysetPaginator
+from .rollups import active_members_per_month, loans_per_day, most_borrowed, rollup_checkpoint
+from .routers import cache_timeout, replica_reads
+from .search import BOOK_SORTS, DEFAULT_BOOK_SORT, search_books, search_members
+from .stats import aborrow_stats, member_borrow_stats, member_stats
+from .utils import ais_librarian, arequest_user, is_librarian, is_member, librarian_required, member_required, create_default_groups
+from .versions import CATALOG, MEMBERS, aget_version, get_version
+
+
+BOOKS_PER_PAGE = 25
+MEMBER_AUTOCOMPLETE_LIMIT = 10
+LOGS_PER_PAGE = 50
+REPORT_DEFAULT_DAYS = 30
+# Rendered tables are keyed by a change version, so this only bounds how
+# long superseded fragments linger in the cache
+FRAGMENT_CACHE_TIMEOUT = 3600
 
 
 def home_redirect(request):
@@ -72,24 +99,63 @@ def user_logout(request):
 	return redirect('library:login')
 
 
+def book_paginator(books, sort=DEFAULT_BOOK_SORT):
+	"""Keyset pages of ``books`` in ``sort`` order, as book_list shows them"""
+	return KeysetPaginator(books, BOOK_SORTS[sort], BOOKS_PER_PAGE)
+
+
+@replica_reads
 @login_required
-def book_list(request):
-	"""Home page - list all books with available copies and borrow form"""
-	books = Book.objects.all()
+async def book_list(request):
+	"""Home page - one page of the catalog, searched and sorted in the database, plus borrow form"""
+	user = await arequest_user(request)
+	librarian = await ais_librarian(user)
+	query = request.GET.get('q', '').strip()
+	sort = request.GET.get('sort', DEFAULT_BOOK_SORT)
+	if sort not in BOOK_SORTS:
+		sort = DEFAULT_BOOK_SORT
 	borrow_form = BorrowForm()
 	
-	if request.method == 'POST' and is_librarian(request.user):
+	if request.method == 'POST' and librarian:
 		borrow_form = BorrowForm(request.POST)
-		if borrow_form.is_valid():
+		# Form validation looks the member up through the sync ORM
+		if await sync_to_async(borrow_form.is_valid)():
 			member = borrow_form.cleaned_data['member']
 			book_id = request.POST.get('book_id')
 			if book_id:
 				return redirect('library:borrow_book', book_id=book_id, member_id=member.id)
 	
+	catalog_version = await aget_version(CATALOG)
+	after, before = request.GET.get('after', ''), request.GET.get('before', '')
+	# Look the rendered table up here rather than in {% cache %}, so a hit
+	# runs no catalog query at all; the key matches the tag in book_list.html
+	cached_table = await cache.aget(make_template_fragment_key(
+		'book_table', [librarian, catalog_version, query, sort, after, before]
+	))
+	page = None
+	if cached_table is None:
+		books = search_books(query, sort)
+		if librarian:
+			# A copy set aside for a hold keeps available_copies at 0 until collected
+			books = books.annotate(ready_hold=Exists(Hold.objects.filter(book=OuterRef('pk'), status=Hold.READY)))
+		paginator = book_paginator(books, sort)
+		try:
+			page = await paginator.apage(after=after, before=before)
+		except InvalidCursor:
+			page = await paginator.apage()
+	
 	context = {
-		'books': books,
+		'books': page,
+		'page': page,
+		'query': query,
+		'sort': sort,
+		'after': after,
+		'before': before,
 		'borrow_form': borrow_form,
-		'is_librarian': is_librarian(request.user),
+		'is_librarian': librarian,
+		'fragment_timeout': cache_timeout(FRAGMENT_CACHE_TIMEOUT),
+		'catalog_version': catalog_version,
+		'cached_table': cached_table,
 	}
 	return render(request, 'library/book_list.html', context)
 
@@ -111,31 +177,50 @@ def members(request):
 	context = {
 		'members': members,
 		'form': form,
+		'stats': member_stats(),
+		'fragment_timeout': FRAGMENT_CACHE_TIMEOUT,
+		'members_version': get_version(MEMBERS),
 	}
 	return render(request, 'library/members.html', context)
 
 
+@librarian_required
+def member_autocomplete(request):
+	"""JSON prefix search over active members for the shared borrow picker (librarians only)"""
+	term = request.GET.get('q', '').strip()
+	if not term:
+		return JsonResponse({'results': []})
+	
+	members = (
+		search_members(term)
+		.filter(is_active=True)
+		.order_by('name_lower')
+		.values('id', 'name', 'email')[:MEMBER_AUTOCOMPLETE_LIMIT]
+	)
+	return JsonResponse({'results': list(members)})
+
+
 @librarian_required
 def borrow_book(request, book_id, member_id):
 	"""Borrow a book action (librarians only)"""
 	book = get_object_or_404(Book, id=book_id)
 	member = get_object_or_404(Member, id=member_id)
 	
-	if book.available_copies > 0:
-		# Create borrow record
-		Borrow.objects.create(
-			book=book, 
-			member=member,
-			borrowed_by=request.user
-		)
-		
-		# Decrease available copies
-		book.available_copies -= 1
-		book.save()
-		
-		messages.success(request, f'Book "{book.title}" borrowed successfully by {member.name}!')
+	try:
+		lend_book(book, member, request.user)
+	except BookUnavailable:
+		hold, created = place_hold(book, member)
+		if hold.status == Hold.READY:
+			messages.warning(request, f'A copy of "{book.title}" is already set aside for {member.name}.')
+		else:
+			verb = 'added to' if created else 'already in'
+			messages.warning(
+				request,
+				f'No copy of "{book.title}" is on the shelf; {member.name} was {verb} the hold queue '
+				f'at position {queue_position(hold)}.'
+			)
 	else:
-		messages.error(request, f'Book "{book.title}" is not available for borrowing.')
+		messages.success(request, f'Book "{book.title}" borrowed successfully by {member.name}!')
 	
 	return redirect('library:book_list')
 
@@ -143,28 +228,21 @@ def borrow_book(request, book_id, member_id):
 @login_required
 def return_book(request, borrow_id):
 	"""Return a book action"""
-	borrow = get_object_or_404(Borrow, id=borrow_id)
+	borrow = get_object_or_404(Borrow.objects.select_related('book', 'member'), id=borrow_id)
 	
 	# Check permissions
-	if not is_librarian(request.user) and borrow.member.user != request.user:
+	if not is_librarian(request.user) and borrow.member.user_id != request.user.id:
 		messages.error(request, 'You can only return your own borrowed books.')
 		return redirect('library:my_borrows')
 	
-	if not borrow.returned:
-		# Update borrow record
-		borrow.returned = True
-		borrow.return_date = timezone.now()
-		borrow.returned_by = request.user
-		borrow.save()
-		
-		# Increase available copies
-		book = borrow.book
-		book.available_copies += 1
-		book.save()
-		
-		messages.success(request, f'Book "{book.title}" returned successfully!')
-	else:
+	try:
+		receive_book(borrow, request.user)
+	except AlreadyReturned:
 		messages.warning(request, 'This book has already been returned.')
+	else:
+		messages.success(request, f'Book "{borrow.book.title}" returned successfully!')
+		if borrow.allocated_hold is not None:
+			messages.info(request, 'The copy is now held for the next member in the queue.')
 	
 	if is_librarian(request.user):
 		return redirect('library:logs')
@@ -172,44 +250,110 @@ def return_book(request, borrow_id):
 		return redirect('library:my_borrows')
 
 
+@replica_reads
 @librarian_required
-def logs(request):
+async def logs(request):
 	"""Borrow logs page with filters (librarians only)"""
+	await arequest_user(request)
 	filter_type = request.GET.get('filter', 'all')
+	if filter_type not in EXPORT_STATUSES:
+		# Unknown filters list everything; normalised so the export link agrees
+		filter_type = 'all'
+	show_archived = request.GET.get('archived') == '1'
 	
+	borrows = Borrow.objects.select_related('book', 'member')
 	if filter_type == 'returned':
-		borrows = Borrow.objects.filter(returned=True)
+		borrows = borrows.filter(returned=True)
 	elif filter_type == 'unreturned':
-		borrows = Borrow.objects.filter(returned=False)
+		borrows = borrows.filter(returned=False)
+	
+	ordering = ('-borrow_date', '-id')
+	if show_archived and filter_type != 'unreturned':
+		archived = ArchivedBorrow.objects.select_related('book', 'member')
+		paginator = MergedKeysetPaginator([borrows, archived], ordering, LOGS_PER_PAGE)
 	else:
-		borrows = Borrow.objects.all()
+		paginator = KeysetPaginator(borrows, ordering, LOGS_PER_PAGE)
+	try:
+		page = await paginator.apage(after=request.GET.get('after'), before=request.GET.get('before'))
+	except InvalidCursor:
+		page = await paginator.apage()
 	
 	context = {
-		'borrows': borrows,
+		'borrows': page,
+		'page': page,
 		'filter_type': filter_type,
+		'show_archived': show_archived,
+		'stats': await aborrow_stats(),
 	}
 	return render(request, 'library/logs.html', context)
 
 
+@replica_reads
+@librarian_required
+def export_logs(request):
+	"""Stream borrow history as CSV or JSON Lines (librarians only)"""
+	fmt = request.GET.get('format', 'csv')
+	status = request.GET.get('status', 'all')
+	if fmt not in EXPORT_FORMATS or status not in EXPORT_STATUSES:
+		return HttpResponseBadRequest('Unknown export format or status.')
+	
+	dates = {}
+	for name in ('since', 'until'):
+		value = request.GET.get(name)
+		try:
+			dates[name] = parse_date(value) if value else None
+		except ValueError:
+			dates[name] = None
+		if value and dates[name] is None:
+			return HttpResponseBadRequest(f'{name} must be a date in YYYY-MM-DD format.')
+	
+	render_lines, content_type = EXPORT_FORMATS[fmt]
+	# Rows stream after the view returns, so pick the database while routing applies
+	rows = export_borrow_rows(dates['since'], dates['until'], status, using=router.db_for_read(Borrow),
+	                          archived=request.GET.get('archived') == '1')
+	lines = render_lines(rows)
+	if isinstance(request, ASGIRequest):
+		lines = astream(lines)
+	response = StreamingHttpResponse(lines, content_type=content_type)
+	response['Content-Disposition'] = f'attachment; filename="borrows.{fmt}"'
+	return response
+
+
+@replica_reads
 @login_required
-def my_borrows(request):
+async def my_borrows(request):
 	"""Show logged-in member's own borrow history. Auto-create profile if missing."""
-	if is_librarian(request.user):
+	user = await arequest_user(request)
+	if await ais_librarian(user):
 		return redirect('library:logs')
 	
 	# Ensure a Member profile exists for the user
-	member, _ = Member.objects.get_or_create(
-		user=request.user,
+	member, _ = await Member.objects.aget_or_create(
+		user=user,
 		defaults={
-			'name': f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username,
-			'email': request.user.email or f"{request.user.username}@example.com",
+			'name': f"{user.first_name} {user.last_name}".strip() or user.username,
+			'email': user.email or f"{user.username}@example.com",
 		}
 	)
-	borrows = Borrow.objects.filter(member=member)
+	borrows = [borrow async for borrow in Borrow.objects.filter(member=member).select_related('book')]
+	show_archived = request.GET.get('archived') == '1'
+	if show_archived:
+		archived = ArchivedBorrow.objects.filter(member=member).select_related('book').order_by('-borrow_date')
+		borrows = sorted(
+			borrows + [borrow async for borrow in archived],
+			key=lambda borrow: (borrow.borrow_date, borrow.id), reverse=True,
+		)
+	holds = [
+		hold async for hold in
+		Hold.objects.filter(member=member, status__in=Hold.ACTIVE).select_related('book').order_by('requested_at')
+	]
 	
 	context = {
 		'borrows': borrows,
+		'holds': holds,
+		'show_archived': show_archived,
 		'member': member,
+		'stats': member_borrow_stats(member),
 	}
 	return render(request, 'library/my_borrows.html', context)
 
@@ -260,3 +404,44 @@ def delete_book(request, book_id):
 		return redirect('library:book_list')
 	
 	return render(request, 'library/delete_book.html', {'book': book})
+
+
+@replica_reads
+@librarian_required
+def reports(request):
+	"""Circulation reports from the rollup tables (librarians only)"""
+	until = timezone.localdate()
+	since = until - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+	dates = {}
+	for name, default in (('since', since), ('until', until)):
+		value = request.GET.get(name)
+		try:
+			dates[name] = parse_date(value) if value else default
+		except ValueError:
+			dates[name] = None
+		if dates[name] is None:
+			return HttpResponseBadRequest(f'{name} must be a date in YYYY-MM-DD format.')
+	since, until = dates['since'], dates['until']
+	if since > until:
+		return HttpResponseBadRequest('since must not be after until.')
+	
+	per_day = loans_per_day(since, until)
+	context = {
+		'since': since,
+		'until': until,
+		'per_day': per_day,
+		'totals': {
+			'borrows': sum(row['borrows'] for row in per_day),
+			'returns': sum(row['returns'] for row in per_day),
+		},
+		'most_borrowed': most_borrowed(since, until),
+		'per_month': active_members_per_month(since, until),
+		'checkpoint': rollup_checkpoint(),
+	}
+	return render(request, 'library/reports.html', context)
+
+
+@librarian_required
+def metrics(request):
+	"""Request timing histograms in Prometheus text format (librarians only)"""
+	return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
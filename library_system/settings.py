@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.middleware.RequestMetricsMiddleware',
+    'library.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,10 +83,135 @@ WSGI_APPLICATION = 'library_system.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('LIBRARY_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# LIBRARY_DB_PROFILE=production tunes SQLite for several workers sharing the
+# file: WAL so readers never wait for the writer, a busy timeout instead of
+# immediate "database is locked" errors, and persistent connections.
+
+SQLITE_PRODUCTION_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    # With WAL a power cut may lose the last commits but never corrupts the file
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -32000',  # 32 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',  # read up to 256 MB through the page cache of the OS
+    'PRAGMA temp_store = MEMORY',
+]
+
+DATABASE_PROFILES = {
+    'development': {},
+    'production': {
+        'OPTIONS': {
+            'timeout': 20,  # seconds to wait for a lock held by another worker
+            # Take the write lock at BEGIN: a deferred transaction that reads
+            # and then writes fails outright if another worker wrote first,
+            # whatever the timeout
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(SQLITE_PRODUCTION_PRAGMAS),
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+
+LIBRARY_DB_PROFILE = os.environ.get('LIBRARY_DB_PROFILE', 'development')
+if LIBRARY_DB_PROFILE not in DATABASE_PROFILES:
+    raise ImproperlyConfigured(f"LIBRARY_DB_PROFILE must be one of {', '.join(DATABASE_PROFILES)}")
+DATABASES['default'].update(DATABASE_PROFILES[LIBRARY_DB_PROFILE])
+if os.environ.get('LIBRARY_SERVER_MODE') == 'asgi':
+    # Under ASGI each request runs its queries in a thread of its own, so a
+    # persistent connection would be left open per request, never reused
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Read replica for the read-only views (see library/routers.py). Locally the
+# replica is a SQLite copy of the primary that `manage.py refresh_replica`
+# rewrites with the backup API; point LIBRARY_REPLICA_PATH at it to enable.
+if os.environ.get('LIBRARY_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['LIBRARY_REPLICA_PATH'],
+        'OPTIONS': {'init_command': 'PRAGMA query_only = ON'},
+        # Reconnect every request so a refreshed copy is picked up
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['library.routers.ReplicaRouter']
+
+# How far the replica may trail the primary, in seconds. A browser that just
+# wrote reads from the primary for this long, and pages rendered from the
+# replica are cached for no longer than this.
+REPLICA_MAX_LAG = int(os.environ.get('LIBRARY_REPLICA_MAX_LAG', 30))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# LIBRARY_CACHE picks the backend. Local memory is private to each worker
+# process, so with several gunicorn workers a shared backend (file, redis or
+# memcached) keeps cached pages and versions consistent between them.
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'library_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+}
+
+LIBRARY_CACHE = os.environ.get('LIBRARY_CACHE', 'locmem')
+if LIBRARY_CACHE not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"LIBRARY_CACHE must be one of {', '.join(CACHE_BACKENDS)}")
+
+CACHES = {'default': dict(CACHE_BACKENDS[LIBRARY_CACHE])}
+if os.environ.get('LIBRARY_CACHE_LOCATION'):
+    CACHES['default']['LOCATION'] = os.environ['LIBRARY_CACHE_LOCATION']
+
+
+# Default loan period in days; books can set their own
+LIBRARY_LOAN_DAYS = int(os.environ.get('LIBRARY_LOAN_DAYS', 14))
+
+
+# Sessions and authentication
+# LIBRARY_SESSIONS=cached_db reads sessions through the cache and writes them
+# to both, so logging out (which deletes both copies) takes effect at once.
+# LIBRARY_AUTH=cached loads the request's user, groups and member profile
+# from one cache entry, so a password change or deactivation ends other
+# sessions at once. Both only hold when every worker shares the cache, so
+# they are the default for shared backends only.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+}
+
+LIBRARY_SESSIONS = os.environ.get('LIBRARY_SESSIONS', 'db' if LIBRARY_CACHE == 'locmem' else 'cached_db')
+if LIBRARY_SESSIONS not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"LIBRARY_SESSIONS must be one of {', '.join(SESSION_ENGINES)}")
+SESSION_ENGINE = SESSION_ENGINES[LIBRARY_SESSIONS]
+
+AUTH_BACKENDS = {
+    'db': 'django.contrib.auth.backends.ModelBackend',
+    'cached': 'library.backends.CachedModelBackend',
+}
+
+LIBRARY_AUTH = os.environ.get('LIBRARY_AUTH', 'db' if LIBRARY_CACHE == 'locmem' else 'cached')
+if LIBRARY_AUTH not in AUTH_BACKENDS:
+    raise ImproperlyConfigured(f"LIBRARY_AUTH must be one of {', '.join(AUTH_BACKENDS)}")
+AUTHENTICATION_BACKENDS = [AUTH_BACKENDS[LIBRARY_AUTH]]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators